@@ -0,0 +1,95 @@
+"""Offline runner for the benchmark suites
+
+Runs every `time_*` method of the suites for all parameter combinations and
+reports the best time of a few repeats as records/s and MB/s.
+
+usage:
+    python -m benchmarks [-r REPEAT] [-k PATTERN]
+"""
+
+import argparse
+import itertools
+import time
+from benchmarks import benchmarks
+
+suites = [
+    benchmarks.WriteSuite,
+    benchmarks.ReadSuite,
+    benchmarks.OpenSuite,
+    benchmarks.FrameSuite,
+]
+
+
+def _param_combinations(suite) -> list:
+    params = getattr(suite, "params", [])
+    if len(params) == 0:
+        return [()]
+    if not isinstance(params[0], list):
+        params = [params]
+    return list(itertools.product(*params))
+
+
+def run(repeat: int = 3, pattern: str = "") -> list:
+    """Runs the benchmarks
+
+    Args:
+        repeat (int, optional): number of times each benchmark is run, the best time is reported
+        pattern (str, optional): only run benchmarks which name contains `pattern`
+
+    Returns:
+        list: (name, parameters, time, records/s, MB/s) for each benchmark
+    """
+    results = []
+    for suite in suites:
+        methods = sorted(m for m in dir(suite) if m.startswith("time_"))
+        for method in methods:
+            name = "{}.{}".format(suite.__name__, method)
+            if pattern not in name:
+                continue
+            for params in _param_combinations(suite):
+                best = None
+                for _ in range(repeat):
+                    inst = suite()
+                    inst.setup(*params)
+                    try:
+                        t0 = time.perf_counter()
+                        getattr(inst, method)(*params)
+                        elapsed = time.perf_counter() - t0
+                    finally:
+                        if hasattr(inst, "teardown"):
+                            inst.teardown(*params)
+                    best = elapsed if best is None else min(best, elapsed)
+                result = (
+                    name,
+                    params,
+                    best,
+                    inst.n_records / best,
+                    inst.n_bytes / best / 1e6,
+                )
+                print(
+                    "{:<40} {:<24} {:9.4f} s {:12.0f} records/s {:9.1f} MB/s".format(
+                        name, str(params), *result[2:]
+                    )
+                )
+                results.append(result)
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Runs the icf benchmarks")
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="number of repeats (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-k", "--pattern", default="", help="only run benchmarks matching the pattern"
+    )
+    args = parser.parse_args(args)
+    run(args.repeat, args.pattern)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Benchmarks of the icf hot paths
+
+The suites follow the conventions of airspeed velocity (asv): `setup` is
+called with the parameters before each timed `time_*` method. Each suite sets
+`n_records` and `n_bytes` in `setup` so that the offline runner
+(`python -m benchmarks`) can report records/s and MB/s. All data is
+synthetic.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from icf.frame import Frame
+from icf.pyicf import ICFFile
+
+
+def _records(n: int, size: int) -> list:
+    rng = np.random.default_rng(0)
+    return [rng.bytes(size) for _ in range(n)]
+
+
+def _write_file(path: str, records: list, bunchsize: int = 1000000, **kwargs):
+    f = ICFFile(path, mode="trunc", bunchsize=bunchsize, **kwargs)
+    f.write_many(records)
+    f.close()
+
+
+class WriteSuite:
+    """Write throughput against the bunch size"""
+
+    params = [[10000, 100000, 1000000], [None, "zlib"]]
+    param_names = ["bunchsize", "compressor"]
+
+    def setup(self, bunchsize, compressor):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "write.icf")
+        self.records = _records(20000, 500)
+        self.n_records = len(self.records)
+        self.n_bytes = sum(len(r) for r in self.records)
+
+    def teardown(self, bunchsize, compressor):
+        shutil.rmtree(self.tmpdir)
+
+    def time_write(self, bunchsize, compressor):
+        f = ICFFile(self.path, mode="trunc", bunchsize=bunchsize, compressor=compressor)
+        for r in self.records:
+            f.write(r)
+        f.close()
+
+    def time_write_many(self, bunchsize, compressor):
+        _write_file(self.path, self.records, bunchsize, compressor=compressor)
+
+
+class ReadSuite:
+    """Sequential and random access reads"""
+
+    params = [[100000, 1000000], [False, True]]
+    param_names = ["bunchsize", "use_mmap"]
+
+    def setup(self, bunchsize, use_mmap):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "read.icf")
+        records = _records(20000, 500)
+        _write_file(self.path, records, bunchsize)
+        self.n_records = len(records)
+        self.n_bytes = sum(len(r) for r in records)
+        self.random_indices = np.random.default_rng(1).permutation(self.n_records)
+        self.f = ICFFile(self.path, mode="r", use_mmap=use_mmap)
+
+    def teardown(self, bunchsize, use_mmap):
+        self.f.close()
+        shutil.rmtree(self.tmpdir)
+
+    def time_read_at_sequential(self, bunchsize, use_mmap):
+        for i in range(self.n_records):
+            self.f.read_at(i)
+
+    def time_read_at_random(self, bunchsize, use_mmap):
+        for i in self.random_indices.tolist():
+            self.f.read_at(i)
+
+    def time_read_many_random(self, bunchsize, use_mmap):
+        self.f.read_many(self.random_indices)
+
+    def time_iter(self, bunchsize, use_mmap):
+        for _ in self.f:
+            pass
+
+
+class OpenSuite:
+    """Time to open a file against the number of entries and sub files"""
+
+    params = [[10000, 100000], [1, 20]]
+    param_names = ["n_entries", "n_sub_files"]
+
+    def setup(self, n_entries, n_sub_files):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "open.icf")
+        records = _records(n_entries // n_sub_files, 16)
+        sub_path = os.path.join(self.tmpdir, "sub.icf")
+        _write_file(sub_path, records, bunchsize=10000)
+        with open(sub_path, "rb") as f:
+            sub_file = f.read()
+        # Concatenated icf files are valid icf files with several sub files
+        with open(self.path, "wb") as f:
+            for _ in range(n_sub_files):
+                f.write(sub_file)
+        self.n_records = len(records) * n_sub_files
+        self.n_bytes = len(sub_file) * n_sub_files
+
+    def teardown(self, n_entries, n_sub_files):
+        shutil.rmtree(self.tmpdir)
+
+    def time_open(self, n_entries, n_sub_files):
+        ICFFile(self.path, mode="r").close()
+
+    def time_open_lazy(self, n_entries, n_sub_files):
+        ICFFile(self.path, mode="r", lazy_index=True).close()
+
+
+class FrameSuite:
+    """Frame serialization of arrays, sequences and scalars"""
+
+    params = ["arrays", "sequences", "scalars"]
+    param_names = ["content"]
+    n_frames = 1000
+
+    def setup(self, content):
+        rng = np.random.default_rng(2)
+        self.frames = []
+        for i in range(self.n_frames):
+            frame = Frame()
+            if content == "arrays":
+                frame["a"] = rng.uniform(size=(10, 10))
+                frame["b"] = np.arange(100, dtype=np.int32)
+            elif content == "sequences":
+                frame["a"] = rng.uniform(size=100).tolist()
+                frame["b"] = [i, float(i), "s", (1, 2)]
+            else:
+                frame["a"] = i
+                frame["b"] = float(i)
+                frame["c"] = "a string"
+            self.frames.append(frame)
+        self.data = [frame.serialize() for frame in self.frames]
+        self.n_records = len(self.data)
+        self.n_bytes = sum(len(d) for d in self.data)
+
+    def time_serialize(self, content):
+        for frame in self.frames:
+            frame.serialize()
+
+    def time_deserialize(self, content):
+        for data in self.data:
+            for _ in Frame.deserialize(data).items():
+                pass
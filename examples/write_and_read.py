@@ -1,27 +1,11 @@
-import pyarrow
-from icf import io
+from icf.pyicf import ICFFile
 from icf.frame import Frame
 import numpy as np
 from datetime import datetime
 
 
-class MyObject:
-    def __init__(self):
-        self.array = np.random.exponential(
-            np.random.uniform(0, 2),
-            (int(np.random.uniform(1, 100)), int(np.random.uniform(1, 100))),
-        )
-
-    def serialize(self):
-        return pyarrow.serialize(self.array).to_buffer()
-
-    @classmethod
-    def deserialize(self, data):
-        return pyarrow.deserialize(data)
-
-
 startTime = datetime.now()
-writer = io.IndexedContainerWriter("testing.icf", compressor=None)  #'bz2')
+writer = ICFFile("testing.icf", mode="trunc", compressor=None)  #'bz2')
 for i in range(90000):
 
     frame = Frame()
@@ -38,7 +22,7 @@ writer.close()
 print("Time to write:", datetime.now() - startTime)
 
 startTime = datetime.now()
-reader = io.IndexedContainerReader("testing.icf")
+reader = ICFFile("testing.icf", mode="r")
 frames = []
 raws = reader[:]
 for r in raws:
@@ -1,5 +1,6 @@
 import struct
 import numpy as np
+from functools import lru_cache
 from importlib import import_module
 import logging
 import sys
@@ -35,6 +36,16 @@ def dispatch_serializer(obj):
     return obj
 
 
+def _deserialize(cls, data, copy: bool = False):
+    # Only the serializers defined in this module take `copy` and views of
+    # the serialized data, other classes are called with the data as bytes
+    if cls.__module__ == __name__:
+        return cls.deserialize(data, copy=copy)
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return cls.deserialize(data)
+
+
 class N(SerializationDispatcher, types=[np.ndarray]):
 
     _big = sys.byteorder == "big"
@@ -75,13 +86,18 @@ class N(SerializationDispatcher, types=[np.ndarray]):
         return data
 
     @classmethod
-    def deserialize(cls, data):
+    def deserialize(cls, data, copy=False):
         dtype = cls._types_r[data[0]]
         ndim = data[1]
         shape = struct.unpack(f"<{ndim}I", data[2 : 2 + ndim * 4])
         arr = np.frombuffer(data[2 + ndim * 4 :], dtype)
         if cls._big:
-            arr.byteswap(True)
+            arr = arr.byteswap()
+        elif copy:
+            arr = arr.copy()
+        else:
+            # The array is a view of the serialized data
+            arr.flags.writeable = False
         return arr.reshape(shape)
 
 
@@ -93,8 +109,8 @@ class S(SerializationDispatcher, types=[str]):
         return self.str.encode()
 
     @classmethod
-    def deserialize(cls, data):
-        return data.decode()
+    def deserialize(cls, data, copy=False):
+        return str(data, "utf-8")
 
 
 class B(SerializationDispatcher, types=[bytes, bytearray]):
@@ -105,8 +121,8 @@ class B(SerializationDispatcher, types=[bytes, bytearray]):
         return self.bytes
 
     @classmethod
-    def deserialize(cls, data):
-        return data
+    def deserialize(cls, data, copy=False):
+        return bytes(data) if isinstance(data, memoryview) or copy else data
 
 
 class I(SerializationDispatcher, types=[int]):
@@ -118,7 +134,7 @@ class I(SerializationDispatcher, types=[int]):
         return self.int.to_bytes(size, byteorder="little")
 
     @classmethod
-    def deserialize(cls, data):
+    def deserialize(cls, data, copy=False):
         return int.from_bytes(data, byteorder="little")
 
 
@@ -132,7 +148,7 @@ class F(SerializationDispatcher, types=[float]):
         return self.encode.pack(self.float)
 
     @classmethod
-    def deserialize(cls, data):
+    def deserialize(cls, data, copy=False):
         return cls.encode.unpack(data)[0]
 
 
@@ -147,7 +163,7 @@ class C(SerializationDispatcher, types=[complex]):
         return data
 
     @classmethod
-    def deserialize(cls, data):
+    def deserialize(cls, data, copy=False):
         real, imag = cls.encode.unpack(data)
         return complex(real, imag)
 
@@ -155,11 +171,46 @@ class C(SerializationDispatcher, types=[complex]):
 class Q(SerializationDispatcher, types=[list, tuple, set]):
     seq_types = {list: "L", tuple: "T", set: "E"}
     seq_types_r = {v: k for k, v in seq_types.items()}
+    # Sequences of only ints, floats or complex numbers are stored as one
+    # packed array marked by the lower case sequence type followed by the
+    # element type
+    packed_types = {int: b"q", float: b"d", complex: b"D"}
+    packed_dtypes = {
+        b"q": np.dtype("<i8"),
+        b"d": np.dtype("<f8"),
+        b"D": np.dtype("<c16"),
+    }
+    packed_types_r = {v.lower(): k for k, v in seq_types.items()}
 
     def __init__(self, obj):
         self.seqcon = obj
 
+    def _serialize_packed(self):
+        if len(self.seqcon) == 0:
+            return None
+        el_types = set(map(type, self.seqcon))
+        if len(el_types) != 1:
+            return None
+        el_type = el_types.pop()
+        if el_type not in self.packed_types:
+            return None
+        code = self.packed_types[el_type]
+        try:
+            arr = np.fromiter(
+                self.seqcon, self.packed_dtypes[code], count=len(self.seqcon)
+            )
+        except OverflowError:
+            # ints that do not fit in 64 bits
+            return None
+        data = bytearray(self.seq_types[type(self.seqcon)].lower().encode())
+        data.extend(code)
+        data.extend(arr.tobytes())
+        return data
+
     def serialize(self):
+        data = self._serialize_packed()
+        if data is not None:
+            return data
         data = bytearray(
             "{}".format(self.seq_types[type(self.seqcon)]), encoding="utf-8"
         )
@@ -181,7 +232,12 @@ class Q(SerializationDispatcher, types=[list, tuple, set]):
         return data
 
     @classmethod
-    def deserialize(cls, data):
+    def deserialize(cls, data, copy=False):
+        data = memoryview(data)
+        if chr(data[0]) in cls.packed_types_r:
+            seq_type = cls.packed_types_r[chr(data[0])]
+            dtype = cls.packed_dtypes[bytes(data[1:2])]
+            return seq_type(np.frombuffer(data[2:], dtype).tolist())
         tmp_list = []
         seq_type = cls.seq_types_r[str(chr(data[0]))]
         data_p = 1
@@ -199,16 +255,158 @@ class Q(SerializationDispatcher, types=[list, tuple, set]):
             # Remove the encoding by dividing by 2
             size //= 2
 
-            tmp_list.append(deserializer.deserialize(data[data_p : data_p + size]))
+            tmp_list.append(
+                _deserialize(deserializer, data[data_p : data_p + size], copy)
+            )
             data_p += size
         return seq_type(tmp_list)
 
 
+@lru_cache(maxsize=None)
+def _import_class(class_: str, module_: str):
+    """Imports the class used to deserialize an object. The result is cached
+    for the lifetime of the process.
+
+    Args:
+        class_ (str): name of the class
+        module_ (str): module of the class, empty for classes in this module
+
+    Returns:
+        type or None: the class or None if it is not found in the module
+    """
+    try:
+        m = import_module(__name__ if module_ == "" else module_)
+        return getattr(m, class_)
+    except AttributeError:
+        return None
+
+
+def _class_entry(obj):
+    # The (class name, module) pair stored for a serialized object, the
+    # module is left empty for the classes in this module
+    module_ = obj.__class__.__module__
+    return obj.__class__.__name__, module_ if module_ != __name__ else ""
+
+
+# Written instead of the length of the class list in the trailer of frames
+# serialized with a schema
+_schema_marker = 0xFFFFFFFF
+
+
+class FrameSchema:
+    """Dictionary of key/type combinations of the objects in frames.
+
+    A frame serialized with a schema stores a 16 bit code per object instead
+    of the key and class names. The schema is meant to be stored once per
+    file, in the header extension, and must be given when the frames are
+    deserialized. Frames with key/type combinations that are not in the
+    schema are serialized with the class names.
+
+    Example:
+        schema = FrameSchema.from_frame(frame)
+        f = ICFFile(path, header_ext=schema.to_bytes())
+        f.write(frame.serialize(schema))
+        ...
+        schema = FrameSchema.from_bytes(f.header_ext)
+        frame = Frame.deserialize(f.read_at(0), schema=schema)
+    """
+
+    _magic = b"ICFS"
+    _version = 0
+
+    def __init__(self, entries=()):
+        """
+        Args:
+            entries (iterable, optional): (key, class name, module) tuples
+        """
+        self._entries = []
+        self._codes = {}
+        for entry in entries:
+            self.add(*entry)
+
+    def add(self, key: str, class_: str, module_: str = "") -> int:
+        """Adds a key/type combination to the schema
+
+        Args:
+            key (str): the key
+            class_ (str): name of the serializer class
+            module_ (str, optional): module of the class, empty for the built in serializers
+
+        Returns:
+            int: the code of the combination
+
+        Raises:
+            ValueError: if the schema is full
+        """
+        entry = (key, class_, module_)
+        if entry not in self._codes:
+            if len(self._entries) > 0xFFFF:
+                raise ValueError("A schema can hold at most 65536 entries")
+            self._codes[entry] = len(self._entries)
+            self._entries.append(entry)
+        return self._codes[entry]
+
+    def add_frame(self, frame: "Frame"):
+        """Adds the key/type combinations of the objects in a frame"""
+        for k, v in frame.items():
+            self.add(k, *_class_entry(dispatch_serializer(v)))
+
+    @classmethod
+    def from_frame(cls, frame: "Frame"):
+        inst = cls()
+        inst.add_frame(frame)
+        return inst
+
+    def codes(self, entries) -> list:
+        """Returns the codes of the (key, class name, module) tuples or None if
+        any of them is not in the schema"""
+        try:
+            return [self._codes[entry] for entry in entries]
+        except KeyError:
+            return None
+
+    def entry(self, code: int) -> tuple:
+        return self._entries[code]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __eq__(self, other):
+        return isinstance(other, FrameSchema) and self._entries == other._entries
+
+    def to_bytes(self) -> bytes:
+        """Serializes the schema, for instance to be used as header extension"""
+        entries = "".join("{},{},{}\n".format(*e) for e in self._entries)
+        return struct.pack("<4sH", self._magic, self._version) + entries.encode()
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """Deserializes a schema
+
+        Args:
+            data (bytes): the serialized schema
+
+        Returns:
+            FrameSchema: the schema
+
+        Raises:
+            ValueError: if `data` is not a serialized schema
+        """
+        if not cls.is_schema(data):
+            raise ValueError("The data is not a serialized frame schema")
+        entries = bytes(data[6:]).decode().split("\n")[:-1]
+        return cls(e.split(",") for e in entries)
+
+    @classmethod
+    def is_schema(cls, data: bytes) -> bool:
+        return data is not None and bytes(data[:4]) == cls._magic
+
+
 class Frame:
     def __init__(self):
         self._objects = {}
-        self._cache = {}
         self._serialized = {}
+        self._copy = False
         self._log = logging.getLogger(__name__)
 
     def add(self, key, obj):
@@ -262,45 +460,59 @@ class Frame:
         keys = set(list(self._objects.keys()) + list(self._serialized.keys()))
         return iter(list(keys))
 
-    def serialize(self) -> bytes:
+    def serialize(self, schema: "FrameSchema" = None) -> bytes:
         """Serializes the frame to a bytestream
 
+        Args:
+            schema (FrameSchema, optional): if given and all key/type
+                combinations of the frame are in the schema the classes are
+                stored as schema codes instead of the class names
+
         Returns:
             bytes: serialized frame
         """
         data_stream = bytearray()
         index = []
-        classes = []
+        entries = []
         pos = 0
         for k, v in self.items():
             v = dispatch_serializer(v)
-            _module = v.__class__.__module__
-            _module = _module if _module != __name__ else ""
-            classes.append("{},{},{}\n".format(k, v.__class__.__name__, _module))
+            entries.append((k,) + _class_entry(v))
             d = v.serialize()
             pos += len(d)
             index.append(pos)
             data_stream.extend(d)
         n_obj = len(index)
 
-        classes = "".join(classes)
-        trailer = struct.pack(
-            "<{}I{}s3I".format(n_obj, len(classes)),
-            *index,
-            classes.encode(),
-            len(classes),
-            n_obj,
-            pos,
-        )
+        codes = None if schema is None else schema.codes(entries)
+        if codes is not None:
+            trailer = struct.pack(
+                "<{0}H{0}I3I".format(n_obj),
+                *codes,
+                *index,
+                _schema_marker,
+                n_obj,
+                pos,
+            )
+        else:
+            classes = "".join("{},{},{}\n".format(*e) for e in entries)
+            trailer = struct.pack(
+                "<{}I{}s3I".format(n_obj, len(classes)),
+                *index,
+                classes.encode(),
+                len(classes),
+                n_obj,
+                pos,
+            )
         data_stream.extend(trailer)
         return data_stream
 
     def _deserialized_obj(self, key):
-        class_, data = self._serialized[key]
-        if self._cache[class_] is not None:
-            cls = self._cache[class_]
+        class_, module_, data = self._serialized[key]
+        cls = _import_class(class_, module_)
+        if cls is not None:
             try:
-                self._objects[key] = cls.deserialize(data)
+                self._objects[key] = _deserialize(cls, data, self._copy)
             except Exception as e:
                 self._log.error(
                     "An error occured while deserializing object {} of type {}:\n{}".format(
@@ -308,44 +520,62 @@ class Frame:
                     )
                 )
         else:
+            self._log.warning(
+                f"Failed to import class `{class_}` to deserialize object at key: `{key}`"
+            )
             # If we don't know how to deserialize the object we just expose
             # the raw byte stream
             self._objects[key] = data
 
     @classmethod
-    def deserialize(cls, data_stream: bytes):
+    def deserialize(
+        cls, data_stream: bytes, copy: bool = False, schema: "FrameSchema" = None
+    ):
         inst = cls()
-        inst.deserialize_m(data_stream)
+        inst.deserialize_m(data_stream, copy, schema)
         return inst
 
-    def deserialize_m(self, data_stream: bytes):
-        """Deserializes a frame from byte buffer
+    def deserialize_m(
+        self, data_stream: bytes, copy: bool = False, schema: "FrameSchema" = None
+    ):
+        """Deserializes a frame from byte buffer. The serialized objects are
+        kept as views of the buffer and numpy arrays are deserialized as
+        read-only views of the buffer unless `copy` is set.
 
         Args:
             data_stream (bytes): byte buffer to be deserialized
+            copy (bool, optional): deserialize objects to copies of the buffer
+            schema (FrameSchema, optional): schema the frame was serialized with
+
+        Raises:
+            ValueError: if the frame was serialized with a schema and none is given
         """
+        data_stream = memoryview(data_stream).cast("B")
+        self._copy = copy
         l_cls, n_obj, indexpos = struct.unpack("<3I", data_stream[-12:])
-        index = struct.unpack("<{}I{}s".format(n_obj, l_cls), data_stream[indexpos:-12])
-        classes = index[n_obj:][0].decode()
-        index = list(index[:n_obj])
+        if l_cls == _schema_marker:
+            if schema is None:
+                raise ValueError("The frame was serialized with a schema")
+            codes = struct.unpack_from("<{}H".format(n_obj), data_stream, indexpos)
+            index = struct.unpack_from(
+                "<{}I".format(n_obj), data_stream, indexpos + 2 * n_obj
+            )
+            entries = [schema.entry(c) for c in codes]
+        else:
+            index = struct.unpack(
+                "<{}I{}s".format(n_obj, l_cls), data_stream[indexpos:-12]
+            )
+            classes = index[n_obj:][0].decode()
+            index = index[:n_obj]
+            entries = [c.split(",") for c in classes.split("\n")[:n_obj]]
         last_pos = 0
-        for i, c in zip(index, classes.split("\n")):
-            key, class_, module_ = c.split(",")
-
-            if class_ not in self._cache.keys():
-                try:
-                    if module_ == "":
-                        m = import_module(__name__)
-                    else:
-                        m = import_module(module_)
-                    self._cache[class_] = getattr(m, class_)
-                except AttributeError:
-                    self._cache[class_] = None
-                    self._log.warn(
-                        f"Failed to import class `{class_}` to deserialize object at key: `{key}`"
-                    )
-            self._serialized[key] = (class_, data_stream[last_pos:i])
+        for i, (key, class_, module_) in zip(index, entries):
+            data = data_stream[last_pos:i]
+            # With `copy` the frame does not hold on to the buffer
+            self._serialized[key] = (class_, module_, bytes(data) if copy else data)
             last_pos = i
+        if copy:
+            data_stream.release()
 
     @classmethod
     def unpack(cls, data_stream: bytes):
@@ -358,7 +588,7 @@ class Frame:
         s = "{\n"
         for k in set(list(self._objects.keys()) + list(self._serialized.keys())):
             if k not in self._objects:
-                class_, _ = self._serialized[k]
+                class_, _, _ = self._serialized[k]
                 obj_str = "**serialized data**"
             else:
                 class_ = type(self._objects[k])
@@ -370,5 +600,122 @@ class Frame:
     def __repr__(self):
         return self.__str__()
 
-
-__all__ = [Frame]
+    def __getstate__(self):
+        # Views of the serialized data are copied to bytes so that the
+        # frame can be pickled
+        state = self.__dict__.copy()
+        state["_serialized"] = {
+            k: (class_, module_, bytes(data))
+            for k, (class_, module_, data) in self._serialized.items()
+        }
+        state["_objects"] = {
+            k: bytes(obj) if isinstance(obj, memoryview) else obj
+            for k, obj in self._objects.items()
+        }
+        return state
+
+
+def _column_item(data_stream, key: str, layouts: dict, schema: FrameSchema = None):
+    # Locates the serialized object at `key` in a serialized frame by
+    # only decoding the frame trailer. The position of the key for a given
+    # class list (or list of schema codes) is cached in `layouts` as most
+    # frames share the same keys.
+    data_stream = memoryview(data_stream).cast("B")
+    l_cls, n_obj, indexpos = struct.unpack_from(
+        "<3I", data_stream, len(data_stream) - 12
+    )
+    with_schema = l_cls == _schema_marker
+    if with_schema:
+        if schema is None:
+            raise ValueError("The frame was serialized with a schema")
+        classes = bytes(data_stream[indexpos : indexpos + 2 * n_obj])
+        indexpos += 2 * n_obj
+    else:
+        classes_pos = indexpos + 4 * n_obj
+        classes = bytes(data_stream[classes_pos : classes_pos + l_cls])
+    layout_key = (with_schema, classes)
+    if layout_key not in layouts:
+        layouts[layout_key] = None
+        if with_schema:
+            entries = [
+                schema.entry(c) for c in struct.unpack("<{}H".format(n_obj), classes)
+            ]
+        else:
+            entries = [c.split(",") for c in classes.decode().split("\n")[:n_obj]]
+        for i, (k, class_, module_) in enumerate(entries):
+            if k == key:
+                layouts[layout_key] = (i, class_, module_)
+                break
+    layout = layouts[layout_key]
+    if layout is None:
+        return None
+    i, class_, module_ = layout
+    stop = struct.unpack_from("<I", data_stream, indexpos + 4 * i)[0]
+    start = struct.unpack_from("<I", data_stream, indexpos + 4 * (i - 1))[0] if i else 0
+    return class_, module_, data_stream[start:stop]
+
+
+def read_column(
+    icffile, key: str, indices=None, chunksize: int = 1024, schema: FrameSchema = None
+):
+    """Reads the object at `key` from many frames stored in an icf file.
+
+    Only the trailer of each frame and the bytes of the requested object are
+    decoded. The frames are read in chunks with `read_many` so that each
+    bunch is only read once. If all objects are numpy arrays with the same
+    shape and dtype they are stacked in one array, otherwise a list of the
+    objects is returned (with None for frames that do not have the key).
+
+    Args:
+        icffile (ICFFile): file with serialized frames
+        key (str): the key of the object
+        indices (iterable, optional): indices of the frames, by default all frames
+        chunksize (int, optional): number of frames read at a time
+        schema (FrameSchema, optional): schema of the frames, by default read from the header extension of the file if it holds one
+
+    Returns:
+        Union[np.ndarray, list]: the stacked arrays or a list of the objects
+    """
+    if schema is None and FrameSchema.is_schema(icffile.header_ext):
+        schema = FrameSchema.from_bytes(icffile.header_ext)
+    if indices is None:
+        indices = np.arange(icffile.size())
+    indices = np.asarray(indices, dtype=np.int64)
+    layouts = {}
+    stacked = None
+    column = None
+    n = 0
+    for chunk_start in range(0, len(indices), chunksize):
+        for data in icffile.read_many(indices[chunk_start : chunk_start + chunksize]):
+            item = _column_item(data, key, layouts, schema)
+            obj = None
+            if item is not None:
+                class_, module_, obj_data = item
+                cls = _import_class(class_, module_)
+                obj = obj_data if cls is None else _deserialize(cls, obj_data)
+
+            if column is None:
+                if n == 0 and isinstance(obj, np.ndarray):
+                    stacked = np.empty((len(indices),) + obj.shape, obj.dtype)
+                if (
+                    stacked is not None
+                    and isinstance(obj, np.ndarray)
+                    and obj.shape == stacked.shape[1:]
+                    and obj.dtype == stacked.dtype
+                ):
+                    stacked[n] = obj
+                else:
+                    # Not stackable, fall back to a list
+                    column = list(stacked[:n]) if stacked is not None else [None] * n
+                    stacked = None
+            if column is not None:
+                column.append(obj)
+            n += 1
+    if column is not None:
+        return column
+    if stacked is None:
+        return []
+    return stacked
+
+
+__all__ = [Frame, FrameSchema]
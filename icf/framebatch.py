@@ -0,0 +1,212 @@
+"""Columnar storage of batches of frames
+
+A batch of frames is stored as one record in an icf file. The record is
+itself a serialized `Frame` in which every key of the batched frames is
+stored as a column:
+
+    `<key>/data`, `<key>/offsets`, `<key>/shapes`: numpy array columns, the
+        flattened arrays concatenated in one array with the element offset
+        and the shape of each array
+    `<key>/objects`: other objects, as a list
+    `<key>/present`: which frames of the batch hold the key, only stored
+        if not all of them do
+
+and `__n__` holds the number of frames in the batch.
+"""
+
+import numpy as np
+from icf.frame import Frame, read_column
+
+
+class FrameBatchWriter:
+    """Accumulates frames and writes them in batches of `batchsize` frames
+    with one column per key.
+
+    Attributes:
+        batchsize (int): number of frames per batch
+    """
+
+    def __init__(self, icffile, batchsize: int = 1000):
+        self._file = icffile
+        self.batchsize = batchsize
+        self._frames = []
+
+    def write(self, frame: Frame):
+        self._frames.append(frame)
+        if len(self._frames) >= self.batchsize:
+            self.flush()
+
+    def flush(self):
+        """Writes the accumulated frames as one batch."""
+        if len(self._frames) == 0:
+            return
+        self._file.write(pack_batch(self._frames).serialize())
+        self._frames = []
+
+    def close(self):
+        """Writes the remaining frames and closes the file."""
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def pack_batch(frames) -> Frame:
+    """Packs a list of frames in a columnar batch frame.
+
+    Args:
+        frames (list): the frames
+
+    Returns:
+        Frame: the batch frame
+    """
+    columns = {}
+    for i, frame in enumerate(frames):
+        for key, obj in frame.items():
+            columns.setdefault(key, []).append((i, obj))
+
+    batch = Frame()
+    batch["__n__"] = len(frames)
+    for key, items in columns.items():
+        objects = [obj for _, obj in items]
+        if len(items) < len(frames):
+            present = np.zeros(len(frames), dtype=np.uint8)
+            present[[i for i, _ in items]] = 1
+            batch["{}/present".format(key)] = present
+        if all(isinstance(obj, np.ndarray) for obj in objects) and (
+            len({obj.dtype for obj in objects}) == 1
+        ):
+            sizes = [obj.size for obj in objects]
+            offsets = np.zeros(len(objects) + 1, dtype=np.uint64)
+            np.cumsum(sizes, out=offsets[1:])
+            ndim = max(obj.ndim for obj in objects)
+            shapes = np.full((len(objects), ndim), -1, dtype=np.int64)
+            for j, obj in enumerate(objects):
+                shapes[j, : obj.ndim] = obj.shape
+            batch["{}/data".format(key)] = np.concatenate(
+                [obj.ravel() for obj in objects]
+            )
+            batch["{}/offsets".format(key)] = offsets
+            batch["{}/shapes".format(key)] = shapes
+        else:
+            batch["{}/objects".format(key)] = objects
+    return batch
+
+
+class FrameBatchReader:
+    """Reads frames and columns from a file written with `FrameBatchWriter`.
+
+    Whole columns of a batch are read as views of the batch record,
+    individual frames are reconstructed on demand.
+    """
+
+    def __init__(self, icffile):
+        self._file = icffile
+        self._starts = None
+
+    def n_batches(self) -> int:
+        return self._file.size()
+
+    def batch(self, batch_n: int) -> Frame:
+        """Returns the (serialized) batch frame of a batch."""
+        return Frame.deserialize(self._file.read_at(batch_n))
+
+    def column(self, key: str, batch_n: int):
+        """Returns the column of `key` in a batch. Array columns where all
+        arrays have the same shape are returned as one array with the
+        frames along the first axis, other columns as a list. Frames that
+        do not hold the key are left out.
+
+        Args:
+            key (str): the key
+            batch_n (int): the batch number
+
+        Returns:
+            Union[np.ndarray, list]: the column
+        """
+        return self._column(self.batch(batch_n), key)
+
+    def _column(self, batch: Frame, key: str):
+        if batch.get("{}/objects".format(key)) is not None:
+            return list(batch["{}/objects".format(key)])
+        data = batch.get("{}/data".format(key))
+        if data is None:
+            return []
+        offsets = batch["{}/offsets".format(key)]
+        shapes = batch["{}/shapes".format(key)]
+        if len(shapes) > 0 and np.all(shapes == shapes[0]):
+            shape = tuple(d for d in shapes[0] if d >= 0)
+            return data.reshape((len(shapes),) + shape)
+        return [
+            data[offsets[i] : offsets[i + 1]].reshape(tuple(d for d in s if d >= 0))
+            for i, s in enumerate(shapes)
+        ]
+
+    def _frame(self, batch: Frame, i: int) -> Frame:
+        frame = Frame()
+        for bkey in batch.keys():
+            key, _, kind = bkey.rpartition("/")
+            if kind not in ("data", "objects"):
+                continue
+            present = batch.get("{}/present".format(key))
+            if present is not None:
+                if not present[i]:
+                    continue
+                # position of the frame among the frames that hold the key
+                j = int(np.count_nonzero(present[:i]))
+            else:
+                j = i
+            if kind == "objects":
+                frame[key] = batch[bkey][j]
+            else:
+                offsets = batch["{}/offsets".format(key)]
+                shape = tuple(d for d in batch["{}/shapes".format(key)][j] if d >= 0)
+                frame[key] = batch[bkey][offsets[j] : offsets[j + 1]].reshape(shape)
+        return frame
+
+    def _batch_starts(self) -> np.ndarray:
+        if self._starts is None:
+            # The number of frames per batch is read from the batch trailers
+            counts = read_column(self._file, "__n__")
+            self._starts = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=self._starts[1:])
+        return self._starts
+
+    def _locate(self, ind: int):
+        if ind < 0:
+            ind += len(self)
+        if ind < 0 or ind >= len(self):
+            raise IndexError(
+                "The requested frame at index ({}) is out of range".format(ind)
+            )
+        starts = self._batch_starts()
+        batch_n = int(np.searchsorted(starts, ind, side="right")) - 1
+        return batch_n, ind - int(starts[batch_n])
+
+    def __len__(self):
+        return int(self._batch_starts()[-1])
+
+    def read_at(self, ind: int) -> Frame:
+        """Reconstructs the frame at index `ind`
+
+        Args:
+            ind (int): the index of the frame
+
+        Returns:
+            Frame: the frame
+        """
+        batch_n, i = self._locate(ind)
+        return self._frame(self.batch(batch_n), i)
+
+    def __getitem__(self, ind: int) -> Frame:
+        return self.read_at(ind)
+
+    def __iter__(self):
+        for data in self._file:
+            batch = Frame.deserialize(data)
+            for i in range(batch["__n__"]):
+                yield self._frame(batch, i)
@@ -1,3 +1,6 @@
 from .icffile import ICFFile
+from .dataset import ICFDataset
+from .parallel import parallel_map
+from .aio import AsyncICFFile
 
 # from . import
@@ -0,0 +1,194 @@
+"""asyncio interface to icf files"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from icf.pyicf.icffile import ICFFile, LazyObjectIndex
+
+
+class AsyncICFFile:
+    """Wraps an `ICFFile` for use from asyncio code.
+
+    Reading bunches, flushing and closing run in a thread pool of at most
+    `max_workers` threads so that the event loop is not blocked by file I/O.
+    Objects are read from the bunch buffer of the file and a bunch that is
+    requested by several coroutines at the same time is only loaded once.
+    Writes that fit in the current bunch are done on the event loop, writes
+    that fill a bunch are flushed in the thread pool.
+
+    Example:
+        async with AsyncICFFile("file.icf", mode="r") as f:
+            obj = await f.read_at(0)
+            async for obj in f:
+                ...
+    """
+
+    def __init__(self, file, max_workers: int = 4, executor=None, **icffile_kwargs):
+        """
+        Args:
+            file (Union[str, ICFFile]): path to the file or an opened file
+            max_workers (int, optional): number of threads doing the file I/O
+            executor (Executor, optional): executor used instead of a private thread pool
+            **icffile_kwargs: passed to `ICFFile` when `file` is a path
+        """
+        if not isinstance(file, ICFFile):
+            file = ICFFile(file, **icffile_kwargs)
+        self.file = file
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers)
+        # Bunches being loaded by global bunch number
+        self._loading = {}
+        self._write_lock = asyncio.Lock()
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, fn, *args
+        )
+
+    async def _build_index(self):
+        if self.file._index_pending:
+            async with self._write_lock:
+                await self._run(self.file._build_index)
+
+    async def _lookup(self, indices: np.ndarray):
+        # The lazy index reads the object table of a bunch on first access
+        if isinstance(self.file._index, LazyObjectIndex):
+            return await self._run(self.file._index.lookup, indices)
+        return self.file._index.lookup(indices)
+
+    async def _bunch(self, bunch_n: int):
+        bunch_id = self.file._bunch_ids[bunch_n]
+        bunch = self.file._buffered_bunch(bunch_id)
+        if bunch is not None:
+            return bunch
+        future = self._loading.get(bunch_n)
+        if future is None:
+            future = asyncio.ensure_future(self._run(self.file._read_bunch, bunch_id))
+            self._loading[bunch_n] = future
+            future.add_done_callback(lambda _: self._loading.pop(bunch_n, None))
+        # A cancelled reader does not cancel the load for the other readers
+        return await asyncio.shield(future)
+
+    def size(self) -> int:
+        return self.file.size()
+
+    def __len__(self):
+        return self.size()
+
+    async def read_at(self, ind: int) -> bytes:
+        """Reads one object at the index indicated by `ind`
+
+        Args:
+            ind (int): the index of the object to be read
+
+        Returns:
+            bytes: that represent the object
+
+        Raises:
+            IndexError: if index out of range
+        """
+        return (await self.read_many([ind]))[0]
+
+    async def read_many(self, indices) -> list:
+        """Reads the objects at the given indices, loading the bunches they
+        are stored in concurrently.
+
+        Args:
+            indices (iterable): indices of the objects to be read
+
+        Returns:
+            list: the objects in the same order as `indices`
+
+        Raises:
+            IndexError: if an index is out of range
+        """
+        await self._build_index()
+        n_entries = self.file.n_entries
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + n_entries, indices)
+        if len(indices) > 0 and (indices.min() < 0 or indices.max() > n_entries - 1):
+            raise IndexError(
+                "The requested file objects at indices ({}) are out of range".format(
+                    indices[(indices < 0) | (indices > n_entries - 1)]
+                )
+            )
+        bunch_ns, offsets, sizes = await self._lookup(indices)
+        unique_bunches = np.unique(bunch_ns).tolist()
+        bunches = dict(
+            zip(
+                unique_bunches,
+                await asyncio.gather(*[self._bunch(b) for b in unique_bunches]),
+            )
+        )
+        return [
+            bunches[b][o : o + s]
+            for b, o, s in zip(bunch_ns.tolist(), offsets.tolist(), sizes.tolist())
+        ]
+
+    async def iter(self, prefetch: int = 4):
+        """Iterates over all objects in the file in order, loading the next
+        `prefetch` bunches while the objects of the current bunch are consumed.
+
+        Args:
+            prefetch (int, optional): number of bunches to read ahead
+
+        Yields:
+            bytes: the objects in the file
+        """
+        await self._build_index()
+        n_bunches = len(self.file._bunch_ids)
+        pending = {}
+        try:
+            for bunch_n in range(n_bunches):
+                for next_bunch in range(
+                    bunch_n, min(bunch_n + prefetch + 1, n_bunches)
+                ):
+                    if next_bunch not in pending:
+                        pending[next_bunch] = asyncio.ensure_future(
+                            self._bunch(next_bunch)
+                        )
+                bunch = await pending.pop(bunch_n)
+                if isinstance(self.file._index, LazyObjectIndex):
+                    offsets, sizes = await self._run(
+                        self.file._index.bunch_entries, bunch_n
+                    )
+                else:
+                    offsets, sizes = self.file._index.bunch_entries(bunch_n)
+                for offset, size in zip(offsets.tolist(), sizes.tolist()):
+                    yield bunch[offset : offset + size]
+        finally:
+            for task in pending.values():
+                task.cancel()
+
+    def __aiter__(self):
+        return self.iter()
+
+    async def write(self, data: bytes):
+        """Writes a stream of bytes to file. The bunch is flushed in the
+        thread pool if the object fills it.
+
+        args:
+            data (bytes): bytes to be writen to file
+        """
+        async with self._write_lock:
+            if self.file._cbunchoffset + len(data) > self.file.bunchsize:
+                await self._run(self.file.write, data)
+            else:
+                self.file.write(data)
+
+    async def flush(self):
+        """Flushes any data in buffer to file."""
+        async with self._write_lock:
+            await self._run(self.file.flush)
+
+    async def close(self):
+        async with self._write_lock:
+            await self._run(self.file.close)
+        if self._own_executor:
+            self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -0,0 +1,125 @@
+"""Compaction of icf files
+
+Streams the objects of one or more icf files into a new file with a single
+sub file and a target bunch size, optionally changing the compression.
+
+usage:
+    python -m icf.pyicf.compact output.icf input1.icf [input2.icf ...]
+"""
+
+import argparse
+import os
+from icf.pyicf.icffile import ICFFile
+from icf.pyicf.compression import CODEC_MASK
+
+
+def compact(
+    inputs,
+    output: str,
+    bunchsize: int = 1000000,
+    compressor: str = None,
+    compression_level: int = None,
+    chunksize: int = 1024,
+) -> int:
+    """Writes all objects of the input files, in order, to a new file with a
+    single sub file and bunches of `bunchsize` bytes. The inputs are opened
+    one at a time and streamed with a lazy index that is not kept, so only
+    the bunch trailers of one input, a bounded number of its bunches and
+    `chunksize` objects are held in memory. The header extension and file
+    identifier extension of the inputs are preserved.
+
+    Args:
+        inputs (Union[str, list]): path or list of paths to the input files
+        output (str): path to the output file, which is overwritten
+        bunchsize (int, optional): target bunch size of the output file
+        compressor (str, optional): compressor of the output file, by default the one of the first input
+        compression_level (int, optional): compression level of the output file
+        chunksize (int, optional): number of objects written at a time
+
+    Returns:
+        int: the number of objects written
+
+    Raises:
+        ValueError: if the output is one of the inputs or the header extensions of the inputs differ
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if any(os.path.abspath(output) == os.path.abspath(path) for path in inputs):
+        raise ValueError("The output file must not be one of the input files")
+
+    # Only the file headers are read before the output is written
+    headers = [_read_header(path) for path in inputs]
+    file_identifier_ext, compression, header_ext = headers[0]
+    for path, header in zip(inputs[1:], headers[1:]):
+        if header[2] != header_ext:
+            raise ValueError(
+                "The header extension of `{}` differs from `{}`".format(
+                    path, inputs[0]
+                )
+            )
+    if compressor is None:
+        compressor = compression & CODEC_MASK
+        if compression_level is None:
+            compression_level = compression >> 8
+
+    with ICFFile(
+        output,
+        mode="trunc",
+        header_ext=header_ext,
+        file_identifier_ext=file_identifier_ext,
+        compressor=compressor,
+        compression_level=compression_level,
+        bunchsize=bunchsize,
+    ) as writer:
+        for path in inputs:
+            with ICFFile(path, mode="r", lazy_index=True) as reader:
+                writer.write_many(
+                    reader.iter(prefetch=2, cache_index=False), chunksize=chunksize
+                )
+        n_entries = writer.size()
+    return n_entries
+
+
+def _read_header(path: str):
+    # Returns the file identifier extension, compression and header
+    # extension of a file without indexing it
+    with open(path, "rb") as f:
+        header = ICFFile._file_header.unpack(f.read(ICFFile._file_header.size))
+        return header[1].rstrip(b"\x00").decode(), header[3], f.read(header[6])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Compacts icf files into one file with a single sub file"
+    )
+    parser.add_argument("output", help="path to the output file")
+    parser.add_argument("inputs", nargs="+", help="paths to the input files")
+    parser.add_argument(
+        "-b",
+        "--bunchsize",
+        type=int,
+        default=1000000,
+        help="target bunch size in bytes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-c",
+        "--compressor",
+        default=None,
+        help="compressor of the output file (default: same as the first input)",
+    )
+    parser.add_argument(
+        "-l", "--level", type=int, default=None, help="compression level"
+    )
+    args = parser.parse_args(args)
+    n = compact(
+        args.inputs,
+        args.output,
+        bunchsize=args.bunchsize,
+        compressor=args.compressor,
+        compression_level=args.level,
+    )
+    print("Wrote {} objects to {}".format(n, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Codecs used to compress the data bunches in an icf file.
+
+The codec used for a bunch is stored in the lowest byte of the `flags` field
+of the bunch trailer so that files written with different compression settings
+can be concatenated. The file header `compression` field records the codec
+(lowest byte) and level (highest byte) the file was created with.
+"""
+import zlib
+import bz2
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+CODEC_MASK = 0xFF
+
+
+class Codec:
+    """Base class for bunch compression codecs.
+
+    Attributes:
+        id (int): codec id stored in the bunch trailer flags
+        name (str): name used to select the codec
+        default_level (int): compression level used if none is given
+    """
+
+    id = 0
+    name = "none"
+    default_level = 0
+    available = True
+
+    def __init__(self, level: int = None):
+        self.level = self.default_level if level is None else level
+
+    def compress(self, data) -> bytes:
+        return data
+
+    def decompress(self, data) -> bytes:
+        return data
+
+
+class ZlibCodec(Codec):
+    id = 1
+    name = "zlib"
+    default_level = 6
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class Bz2Codec(Codec):
+    id = 2
+    name = "bz2"
+    default_level = 9
+
+    def compress(self, data):
+        return bz2.compress(data, self.level)
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+
+class LzmaCodec(Codec):
+    id = 3
+    name = "lzma"
+    default_level = 6
+
+    def compress(self, data):
+        return lzma.compress(data, preset=self.level)
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+
+class ZstdCodec(Codec):
+    id = 4
+    name = "zstd"
+    default_level = 3
+    available = zstandard is not None
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+class Lz4Codec(Codec):
+    id = 5
+    name = "lz4"
+    default_level = 0
+    available = lz4 is not None
+
+    def compress(self, data):
+        return lz4.frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return lz4.frame.decompress(data)
+
+
+codecs = {
+    c.name: c for c in [Codec, ZlibCodec, Bz2Codec, LzmaCodec, ZstdCodec, Lz4Codec]
+}
+codecs_by_id = {c.id: c for c in codecs.values()}
+
+
+def get_codec(compressor=None, level: int = None) -> Codec:
+    """Returns a codec instance for the given compressor name or id.
+
+    Args:
+        compressor (str or int, optional): name or id of the codec, `None` for no compression
+        level (int, optional): compression level, the codec default if not given
+
+    Returns:
+        Codec: the codec
+
+    Raises:
+        ValueError: if the codec is unknown
+        ImportError: if the library needed by the codec is not installed
+    """
+    if compressor is None:
+        compressor = Codec.name
+    table = codecs_by_id if isinstance(compressor, int) else codecs
+    if compressor not in table:
+        raise ValueError("Unknown compressor `{}`".format(compressor))
+    codec = table[compressor]
+    if not codec.available:
+        raise ImportError(
+            "The `{}` compressor requires a library that is not installed".format(
+                codec.name
+            )
+        )
+    return codec(level)
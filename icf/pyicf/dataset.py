@@ -0,0 +1,203 @@
+"""A single indexed view over many icf files"""
+
+from collections import OrderedDict
+import glob
+import json
+import os
+import numpy as np
+from icf.pyicf.icffile import ICFFile
+
+
+class ICFDataset:
+    """Indexed read access to the objects of many icf files as if they were
+    stored in one file.
+
+    The global index is built from the number of entries in each file. Files
+    are opened on demand and kept open in a pool of at most `max_open_files`
+    files, where the least recently used file is closed first. The index of
+    each file is written to its sidecar index file (see `ICFFile.save_index`)
+    when the file is first opened, so that files are not scanned again when
+    they are reopened. The entry counts can be cached in `cache_file`, in
+    which case files that have not changed since the cache was written are
+    not opened when the dataset is created.
+
+    Attributes:
+        files (list): paths to the files in the dataset
+        n_entries (int): total number of objects in the dataset
+    """
+
+    def __init__(
+        self, files, max_open_files: int = 32, cache_file: str = None, **icffile_kwargs
+    ):
+        """
+        Args:
+            files (Union[str, list]): list of paths or a glob pattern
+            max_open_files (int, optional): maximum number of files kept open
+            cache_file (str, optional): path to a file where the entry counts are cached
+            **icffile_kwargs: passed to `ICFFile` when a file is opened
+        """
+        if isinstance(files, str):
+            files = sorted(glob.glob(files))
+        self.files = [str(f) for f in files]
+        self.max_open_files = max_open_files
+        self.cache_file = cache_file
+        icffile_kwargs.setdefault("lazy_index", True)
+        self._icffile_kwargs = icffile_kwargs
+        self._open_files = OrderedDict()
+
+        counts = self._entry_counts()
+        self._starts = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._starts[1:])
+        self.n_entries = int(self._starts[-1])
+
+    def _entry_counts(self) -> list:
+        cache = {}
+        if self.cache_file is not None and os.path.exists(self.cache_file):
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        counts = []
+        updated = False
+        for path in self.files:
+            stat = os.stat(path)
+            entry = cache.get(path)
+            if (
+                entry is None
+                or entry["size"] != stat.st_size
+                or entry["mtime"] != stat.st_mtime_ns
+            ):
+                f = ICFFile(path, mode="r", **self._icffile_kwargs)
+                self._save_index(f, stat)
+                entry = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                    "n_entries": f.size(),
+                }
+                f.close()
+                cache[path] = entry
+                updated = True
+            counts.append(entry["n_entries"])
+        if self.cache_file is not None and updated:
+            tmp_path = self.cache_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_file)
+        return counts
+
+    @staticmethod
+    def _save_index(f: ICFFile, stat: os.stat_result):
+        # Writes the sidecar index of a file unless it is newer than the file
+        path = f._index_filename()
+        if os.path.exists(path) and os.stat(path).st_mtime_ns >= stat.st_mtime_ns:
+            return
+        try:
+            f.save_index()
+        except OSError:
+            # Without write access the file is scanned when it is reopened
+            pass
+
+    def _get_file(self, file_n: int) -> ICFFile:
+        path = self.files[file_n]
+        if path in self._open_files:
+            self._open_files.move_to_end(path)
+            return self._open_files[path]
+        if len(self._open_files) >= self.max_open_files:
+            _, f = self._open_files.popitem(last=False)
+            f.close()
+        # A stale sidecar index is ignored and the file is scanned
+        f = ICFFile(path, mode="r", **self._icffile_kwargs)
+        self._open_files[path] = f
+        return f
+
+    def _locate(self, ind: int):
+        if ind < 0:
+            ind += self.n_entries
+        if ind < 0 or ind > self.n_entries - 1:
+            raise IndexError(
+                "The requested object at index ({}) is out of range".format(ind)
+            )
+        file_n = int(np.searchsorted(self._starts, ind, side="right")) - 1
+        return file_n, ind - int(self._starts[file_n])
+
+    def __len__(self):
+        return self.n_entries
+
+    def size(self):
+        return self.n_entries
+
+    def read_at(self, ind: int) -> bytes:
+        """Reads one object at the index indicated by `ind`
+
+        Args:
+            ind (int): the index of the object in the dataset
+
+        Returns:
+            bytes: that represent the object
+
+        Raises:
+            IndexError: if index out of range
+        """
+        file_n, local_ind = self._locate(ind)
+        return self._get_file(file_n).read_at(local_ind)
+
+    def read_many(self, indices) -> list:
+        """Reads the objects at the given indices, reading the objects of
+        each file together with `ICFFile.read_many`.
+
+        Args:
+            indices (iterable): indices of the objects in the dataset
+
+        Returns:
+            list: the objects in the same order as `indices`
+
+        Raises:
+            IndexError: if an index is out of range
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + self.n_entries, indices)
+        if len(indices) > 0 and (
+            indices.min() < 0 or indices.max() > self.n_entries - 1
+        ):
+            raise IndexError(
+                "The requested objects at indices ({}) are out of range".format(
+                    indices[(indices < 0) | (indices > self.n_entries - 1)]
+                )
+            )
+        file_ns = np.searchsorted(self._starts, indices, side="right") - 1
+        data = [None] * len(indices)
+        for file_n in np.unique(file_ns).tolist():
+            positions = np.flatnonzero(file_ns == file_n)
+            objects = self._get_file(file_n).read_many(
+                indices[positions] - self._starts[file_n]
+            )
+            for pos, obj in zip(positions.tolist(), objects):
+                data[pos] = obj
+        return data
+
+    def __getitem__(self, ind):
+        if isinstance(ind, slice):
+            return self.read_many(np.arange(*ind.indices(self.n_entries)))
+        elif isinstance(ind, (list, np.ndarray)):
+            return self.read_many(ind)
+        elif isinstance(ind, int):
+            return self.read_at(ind)
+
+    def __iter__(self):
+        for file_n in range(len(self.files)):
+            yield from self._get_file(file_n)
+
+    def close(self):
+        while len(self._open_files) > 0:
+            _, f = self._open_files.popitem()
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __str__(self):
+        s = "{}:\n".format(self.__class__.__name__)
+        s += "number of files: {}\n".format(len(self.files))
+        s += "n_entries: {}".format(self.n_entries)
+        return s
@@ -1,11 +1,19 @@
 """Summary
 """
 import struct
-from collections import deque, namedtuple
+from collections import deque, namedtuple, OrderedDict
+from itertools import count, islice
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 import os
+import math
+import mmap
+import queue
+import threading
+import time
 import numpy as np
 from icf.utils import get_si_prefix
+from icf.pyicf.compression import get_codec, CODEC_MASK
 
 
 class ICFFile:
@@ -26,11 +34,46 @@ class ICFFile:
     _file_header = struct.Struct("<4s4s2HQ2H")
     _bunch_trailer_header = struct.Struct("<2H4Q3I")
     _BunchTrailer = namedtuple(
-        "BunchTrailer", "bunchoff dataoff fileoff bunchsize ndata index objsize bunch_n"
+        "BunchTrailer",
+        "bunchoff dataoff fileoff bunchsize ndata index objsize bunch_n timestamp flags",
+    )
+    # Layout of the persisted index (sidecar) file
+    _index_file_header = struct.Struct("<4s2H5Q")
+    _index_file_version = 0
+    _index_bunch_dtype = np.dtype(
+        [
+            ("file_n", "<u4"),
+            ("bunch_n", "<u4"),
+            ("bunchoff", "<u8"),
+            ("dataoff", "<u8"),
+            ("fileoff", "<u8"),
+            ("ndata", "<u4"),
+            ("flags", "<u4"),
+            ("timestamp", "<u8"),
+        ]
     )
     _ObjectOffset = namedtuple("ObjectOffset", "bunch_id offset size")
-    _BunchOffset = namedtuple("BunchOffset", "offset size")
+    _BunchOffset = namedtuple("BunchOffset", "offset size codec")
     _BunchID = namedtuple("BunchID", "file_n bunch_n")
+    # Largest gap between two bunches and largest total size for which
+    # bunches are read with a single read in `read_many`
+    _max_read_gap = 1 << 16
+    _max_read_size = 1 << 26
+    # Bunch trailer flag set when the trailer holds a timestamp per object
+    _record_timestamps_flag = 0x100
+    _buffer_owners = count()
+    # Counters kept when the file is instrumented
+    _stats_counters = (
+        "records_written",
+        "bytes_written",
+        "flushes",
+        "flush_time",
+        "bunch_loads",
+        "buffer_hits",
+        "seeks",
+        "bytes_read",
+        "scan_time",
+    )
 
     def __init__(
         self,
@@ -38,35 +81,97 @@ class ICFFile:
         mode="append",
         header_ext: bytes = None,
         file_identifier_ext: str = "",
-        compressor=None,
+        compressor: str = None,
         bunchsize: int = 1000000,
-        custom_stream = None
+        custom_stream = None,
+        persist_index: bool = False,
+        use_mmap: bool = False,
+        compression_level: int = None,
+        buffer_size: int = None,
+        bunch_buffer: "BunchBuffer" = None,
+        async_write: bool = False,
+        write_queue_size: int = 1,
+        lazy_index: bool = False,
+        scan_workers: int = None,
+        record_timestamps: bool = False,
+        instrument: bool = False,
+        stats_hook=None,
+        _index_data: bytes = None,
     ):
+        self.filename = None if custom_stream is not None else filename
+        self.persist_index = persist_index
         self.bunchsize = bunchsize
         self.header_ext = header_ext
         self.file_identifier_ext = file_identifier_ext
         self.version = 0
-        self._index = []
+        self._index = ObjectIndex()
+        self._lazy_index = lazy_index
+        self._scan_workers = scan_workers
+        self._bunch_ids = []
         self._bunch_index = {}
         self._rawindex = {}
         self.n_entries = 0
         self._cbunchoffset = 0
         self._last_bunch_fp = 0
         self._bunch_number = 0
-        self._bunch_buffer = BunchBuffer(10)
+        # The bunch buffer is either shared between files or private to this
+        # file, bounded by `buffer_size` bytes or by default by 10 bunches
+        if bunch_buffer is None:
+            bunch_buffer = BunchBuffer(10 if buffer_size is None else None, buffer_size)
+        self._bunch_buffer = bunch_buffer
+        self._buffer_owner = next(self._buffer_owners)
         self._file_index = [0]
         self._write_buffer = bytearray()
         self._cbunchindex = []
+        self.record_timestamps = record_timestamps
+        self._cbunchtimes = []
+        self._record_times = {}
+        self._io_lock = threading.RLock()
+        self._writer_error = None
+        self._write_queue = None
+        self._writer = None
+        # The counters are only kept when instrumented, every update is
+        # guarded by a check that `_stats` is not None
+        self._stats = None
+        self._stats_hook = stats_hook
+        # Counters are updated from the prefetch and writer threads
+        self._stats_lock = threading.Lock()
+        if instrument or stats_hook is not None:
+            self._stats = dict.fromkeys(self._stats_counters, 0)
         omode = "b"
-        if mode == "append":
+        if mode in ("append", "append_only"):
             omode += "a+"
         elif mode == "trunc":
             omode += "w+"
         else:
             omode += "r"
+        self._omode = omode
+        # Options used to reopen the file in another process when unpickled
+        self._reader_options = dict(
+            use_mmap=use_mmap,
+            lazy_index=lazy_index,
+            buffer_size=buffer_size,
+            instrument=instrument,
+        )
+        # Process that opened the file handle, see `_check_process`
+        self._pid = os.getpid()
+        # Set when the index of an existing file is built on first read
+        self._index_pending = False
 
+        if use_mmap and omode != "br":
+            raise ValueError("Memory mapping is only supported in read mode ('r')")
         self._file = custom_stream or open(filename, omode)
-        self.compression = 0
+        if omode == "bw+" and self.filename is not None:
+            # The sidecar index of the truncated file is stale
+            try:
+                os.remove(self._index_filename())
+            except FileNotFoundError:
+                pass
+        self._codec = get_codec(compressor, compression_level)
+        self._codecs = {self._codec.id: self._codec}
+        self.compression = self._codec.id | (self._codec.level << 8)
+        self._mmap = None
+        self._view = None
 
         self._file.seek(0, os.SEEK_END)
         self.filesize = self._file.tell()
@@ -81,15 +186,51 @@ class ICFFile:
                 _,
                 ext_len,
             ) = self._file_header.unpack(self._file.read(self._file_header.size))
-            self.file_identifier_ext = fd_ext
+            self.file_identifier_ext = fd_ext.rstrip(b"\x00").decode()
             self.header_ext = self._file.read(ext_len)
-            raw_index = self._scan_file()
+            if compressor is None and "a" in omode:
+                # Continue with the compression the file was created with
+                self._codec = self._get_codec(self.compression & CODEC_MASK)
+                self._codec.level = self.compression >> 8
+            # A bunch that is being written, or was cut off, at the end of
+            # the file is left out until it is complete (see `refresh`)
+            header_end = self._file.tell()
+            self.filesize = self._complete_size(header_end, self.filesize)
+            self._indexed_size = self.filesize
+            if self.filesize == header_end:
+                # Only the header has been written so far
+                persisted = (self._file_index, {})
+            elif mode == "append_only":
+                # Only the last bunch trailer is needed to continue writing
+                last_bt_fp = self._get_last_bunch_trailer(self.filesize)
+                self._file.seek(last_bt_fp)
+                bt = self._read_bunch_trailer(read_index=False)
+                persisted = ([last_bt_fp - bt.fileoff], {})
+                self._bunch_number = bt.bunch_n + 1
+                self._last_bunch_fp = last_bt_fp
+                self._index_pending = True
+            elif _index_data is not None:
+                persisted = self._unpack_index(_index_data)
+            else:
+                persisted = self._load_index_file()
+            if persisted is None:
+                t0 = time.perf_counter()
+                raw_index = self._scan_file()
+                if self._stats is not None:
+                    self._record("scan_time", time.perf_counter() - t0)
+            else:
+                self._file_index, raw_index = persisted
             # raw_index = self._scan_sub_file(self._file.tell(), self.filesize)
             self._construct_file_index(raw_index)
+            self._continue_bunch_chain()
+            if use_mmap:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
 
         else:
             self.timestamp = int(datetime.now().timestamp())
             header_ext = b"" if header_ext is None else header_ext
+            self.header_ext = header_ext
             self._file.write(
                 self._file_header.pack(
                     "ICF".encode(),
@@ -101,6 +242,16 @@ class ICFFile:
                     len(header_ext),
                 )
             )
+            self._file.write(header_ext)
+            # End of the part of the file that is indexed, see `refresh`
+            self._indexed_size = self.get_file_size()
+
+        if async_write:
+            # Filled bunches are written by a background thread while the
+            # next bunch is filled, the queue size bounds the memory used
+            self._write_queue = queue.Queue(write_queue_size)
+            self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
 
     def __getitem__(self, ind) -> bytes:
         """Indexing interface to the streamed file.
@@ -112,12 +263,13 @@ class ICFFile:
         Returns:
             bytes: Bytes that represent the read object
         """
+        self._check_process()
+        if self._index_pending:
+            self._build_index()
         if isinstance(ind, slice):
-            data = [self.read_at(ii) for ii in range(*ind.indices(self.n_entries))]
-            return data
-        elif isinstance(ind, list):
-            data = [self.read_at(ii) for ii in ind]
-            return data
+            return self.read_many(np.arange(*ind.indices(self.n_entries)))
+        elif isinstance(ind, (list, np.ndarray)):
+            return self.read_many(ind)
         elif isinstance(ind, int):
             return self.read_at(ind)
 
@@ -125,96 +277,499 @@ class ICFFile:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._writer.close()
+        self.close()
+
+    def __getstate__(self):
+        # A reader is pickled as its path and packed index, the unpickled
+        # reader opens its own handle and does not scan the file again
+        if self.filename is None or self._omode != "br":
+            raise TypeError(
+                "Only files opened from a path in read mode ('r') can be pickled"
+            )
+        return {
+            "filename": self.filename,
+            "index": bytes(self._pack_index()),
+            "options": self._reader_options,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(
+            state["filename"],
+            mode="r",
+            _index_data=state["index"],
+            **state["options"],
+        )
+
+    def _check_process(self):
+        # After a fork the child shares the file handle (and its position),
+        # the locks and the bunch buffer with the parent. The child opens
+        # its own handle for reading and gets a new bunch buffer on first use.
+        # The public methods call this before any lock is taken, as a lock
+        # held by another thread of the parent is never released in the child.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._io_lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._bunch_buffer = BunchBuffer(
+            self._bunch_buffer.size, self._bunch_buffer.max_bytes
+        )
+        if self.filename is not None:
+            self._file = open(self.filename, "br")
 
     def get_file_size(self):
-        self._file.seek(0, os.SEEK_END)
-        self.filesize = self._file.tell()
+        self._check_process()
+        with self._io_lock:
+            self._file.seek(0, os.SEEK_END)
+            self.filesize = self._file.tell()
         return self.filesize
 
     def get_timestamp(self):
         return datetime.fromtimestamp(self.timestamp)
 
+    def stats(self) -> dict:
+        """Returns the counters of an instrumented file together with the
+        statistics of the bunch buffer.
+
+        The counters, present if the file is opened with `instrument=True` or
+        a `stats_hook`, are:
+            records_written, bytes_written: objects and (uncompressed) bytes written
+            flushes, flush_time: bunches written and time spent compressing and writing them in seconds
+            bunch_loads: bunches read from the file
+            buffer_hits: bunches found in the bunch buffer
+            seeks, bytes_read: seeks and bytes read when loading bunches
+            scan_time: time spent scanning the file for bunch trailers when opened in seconds
+
+        Returns:
+            dict: the counters and the bunch buffer statistics under `buffer`
+        """
+        with self._stats_lock:
+            stats = {} if self._stats is None else dict(self._stats)
+        stats["buffer"] = self._bunch_buffer.stats()
+        return stats
+
+    def _record(self, counter: str, value):
+        # Adds `value` to a counter and passes it on to the stats hook
+        with self._stats_lock:
+            self._stats[counter] += value
+        if self._stats_hook is not None:
+            self._stats_hook(counter, value)
+
     def write(self, data: bytes):
         """Writes a stream of bytes to file
 
         args:
             data (bytes): bytes to be writen to file
         """
+        if self._writer_error is not None:
+            self._raise_writer_error()
 
+        if len(self._cbunchindex) == 0:
+            self._start_bunch()
         self._write_buffer.extend(data)
 
         self.n_entries += 1
-        bunch_id = self._BunchID(self._file_index[-1], self._bunch_number)
-        self._bunch_buffer.set_curr_wbunch(bunch_id, self._write_buffer)
-
-        self._index.append(self._ObjectOffset(bunch_id, self._cbunchoffset, len(data)))
+        self._index.append(len(self._bunch_ids) - 1, self._cbunchoffset, len(data))
         self._cbunchoffset += len(data)
         self._cbunchindex.append(len(data))
+        if self.record_timestamps:
+            self._cbunchtimes.append(time.time_ns())
+        if self._stats is not None:
+            self._record("records_written", 1)
+            self._record("bytes_written", len(data))
         if self._cbunchoffset > self.bunchsize:
             self.flush()
 
+    def _start_bunch(self):
+        # First object of a new bunch, register the bunch
+        bunch_id = self._BunchID(len(self._file_index) - 1, self._bunch_number)
+        self._bunch_ids.append(bunch_id)
+        self._bunch_buffer.pin((self._buffer_owner, bunch_id), self._write_buffer)
+
+    def write_many(self, objects, chunksize: int = 65536):
+        """Writes many objects to file. The objects are joined in chunks of
+        `chunksize` objects and written with `write_packed`.
+
+        args:
+            objects (iterable): byte buffers to be written to file
+            chunksize (int, optional): number of objects joined at a time
+        """
+        objects = iter(objects)
+        while True:
+            chunk = list(islice(objects, chunksize))
+            if len(chunk) == 0:
+                break
+            self.write_packed(
+                b"".join(chunk), np.fromiter(map(len, chunk), np.uint64, len(chunk))
+            )
+
+    def write_packed(self, data: bytes, sizes: np.ndarray):
+        """Writes many objects stored back to back in one buffer to file. The
+        result is the same as writing each object with `write` but the
+        index and the bunches are updated in bulk.
+
+        args:
+            data (bytes): buffer holding the objects
+            sizes (np.ndarray): sizes of the objects in `data`
+
+        Raises:
+            ValueError: if the sizes do not add up to the size of `data`
+        """
+        if self._writer_error is not None:
+            self._raise_writer_error()
+        data = memoryview(data).cast("B")
+        sizes = np.asarray(sizes, dtype=np.uint64)
+        ends = np.cumsum(sizes)
+        n = len(sizes)
+        if (ends[-1] if n > 0 else 0) != len(data):
+            raise ValueError("The object sizes do not match the size of the buffer")
+
+        first = 0
+        while first < n:
+            if len(self._cbunchindex) == 0:
+                self._start_bunch()
+            start = int(ends[first] - sizes[first])
+            # As in `write`, the bunch is flushed after the first object that
+            # brings it over `bunchsize`
+            last = int(
+                np.searchsorted(
+                    ends, start + self.bunchsize - self._cbunchoffset, side="right"
+                )
+            )
+            last = min(last, n - 1)
+            stop = int(ends[last])
+            bunch_sizes = sizes[first : last + 1]
+            self._index.extend(
+                len(self._bunch_ids) - 1,
+                ends[first : last + 1] - bunch_sizes - start + self._cbunchoffset,
+                bunch_sizes,
+            )
+            self._write_buffer.extend(data[start:stop])
+            self._cbunchindex.extend(bunch_sizes.tolist())
+            if self.record_timestamps:
+                self._cbunchtimes.extend([time.time_ns()] * len(bunch_sizes))
+            self._cbunchoffset += stop - start
+            self.n_entries += last + 1 - first
+            if self._stats is not None:
+                self._record("records_written", last + 1 - first)
+                self._record("bytes_written", stop - start)
+            first = last + 1
+            if self._cbunchoffset > self.bunchsize:
+                self.flush()
+
     def _write(self, data: bytes):
         self._file.write(data)
 
     def flush(self):
-        """Flushes any data in buffer to file."""
+        """Flushes any data in buffer to file. With `async_write` the bunch
+        is handed over to the writer thread, blocking while the write
+        queue is full.
+        """
+        self._raise_writer_error()
         if len(self._write_buffer) < 1:
             return
-        self._file.seek(0, os.SEEK_END)
-
-        bunch_start_fp = self._file.tell()  # self._fp
-
-        # writing the data bunch
-        self._write(self._write_buffer)
-        curr_bt_fp = self._file.tell()
-
-        # Constructing and writing bunch trailer header
-        bunch_index_trailer = self._bunch_trailer_header.pack(
-            self.version,
-            0,
-            int(datetime.now().timestamp()),
-            curr_bt_fp,
-            curr_bt_fp - self._last_bunch_fp,
-            curr_bt_fp - bunch_start_fp,
-            len(self._cbunchindex),
+        times = None
+        if self.record_timestamps:
+            times = np.array(self._cbunchtimes, dtype="<u8")
+            # Kept until the bunch is written
+            self._record_times[self._bunch_ids[-1]] = times
+        bunch = (
+            self._bunch_ids[-1],
+            self._write_buffer,
+            np.array(self._cbunchindex, dtype="<u4"),
             self._bunch_number,
-            0,
+            times,
         )
-        self._write(bunch_index_trailer)
-
-        # constructing the index and writing it in the bunch trailer
-        n = len(self._cbunchindex)
-        bunch_index = struct.pack("<{}I".format(n), *self._cbunchindex)
-        self._write(bunch_index)
-
-        # Write offset to begining of bunch trailer
-        self._write(struct.pack("<I", self._file.tell() - curr_bt_fp))
-
-        # Keep the file pointer for the current bunch
-        self._last_bunch_fp = curr_bt_fp
-
-        self._file.flush()
         # reseting/updating the last bunch descriptors
         self._write_buffer = bytearray()
         self._cbunchindex.clear()
+        self._cbunchtimes.clear()
         self._cbunchoffset = 0
         self._bunch_number += 1
+        if self._write_queue is not None:
+            self._write_queue.put(bunch)
+        else:
+            self._write_bunch(*bunch)
 
-    def close(self):
+    def _write_bunch(self, bunch_id, buffer, objsizes, bunch_number, times=None):
+        if self._stats is not None:
+            t0 = time.perf_counter()
+        data = self._codec.compress(buffer)
+        n = len(objsizes)
+        flags = self._codec.id
+        if times is not None:
+            flags |= self._record_timestamps_flag
+        with self._io_lock:
+            self._file.seek(0, os.SEEK_END)
+
+            bunch_start_fp = self._file.tell()  # self._fp
+
+            # writing the data bunch
+            self._write(data)
+            curr_bt_fp = self._file.tell()
+
+            # Constructing and writing bunch trailer header
+            timestamp = int(datetime.now().timestamp())
+            bunch_index_trailer = self._bunch_trailer_header.pack(
+                self.version,
+                0,
+                timestamp,
+                curr_bt_fp - self._file_index[-1],
+                curr_bt_fp - self._last_bunch_fp,
+                curr_bt_fp - bunch_start_fp,
+                n,
+                bunch_number,
+                flags,
+            )
+            self._write(bunch_index_trailer)
+
+            # writing the index in the bunch trailer
+            self._write(objsizes.tobytes())
+            if times is not None:
+                # followed by the object timestamps in nano seconds
+                self._write(times.tobytes())
+
+            # Write offset to begining of bunch trailer
+            self._write(struct.pack("<I", self._file.tell() - curr_bt_fp))
+
+            self._bunch_index[bunch_id] = self._BunchOffset(
+                bunch_start_fp - self._file_index[-1],
+                curr_bt_fp - bunch_start_fp,
+                self._codec.id,
+            )
+            offsets = np.zeros(n, dtype=np.uint64)
+            np.cumsum(objsizes[:-1], out=offsets[1:])
+            self._rawindex[bunch_id] = self._BunchTrailer(
+                curr_bt_fp - self._last_bunch_fp,
+                curr_bt_fp - bunch_start_fp,
+                curr_bt_fp - self._file_index[-1],
+                curr_bt_fp - bunch_start_fp,
+                n,
+                offsets,
+                objsizes,
+                bunch_number,
+                timestamp,
+                flags,
+            )
+            # Keep the file pointer for the current bunch
+            self._last_bunch_fp = curr_bt_fp
+            self._indexed_size = self._file.tell()
+            # The object timestamps are read back from the trailer from now on
+            self._record_times.pop(bunch_id, None)
+
+            self._file.flush()
+            if self._stats is not None:
+                self._record("flushes", 1)
+                self._record("flush_time", time.perf_counter() - t0)
+        # The written bunch stays readable from the buffer until evicted
+        key = (self._buffer_owner, bunch_id)
+        self._bunch_buffer.unpin(key)
+        self._bunch_buffer[key] = buffer
+
+    def _writer_loop(self):
+        while True:
+            bunch = self._write_queue.get()
+            try:
+                if bunch is None:
+                    return
+                if self._writer_error is None:
+                    self._write_bunch(*bunch)
+            except Exception as e:
+                # Bunches queued after a failed write are dropped to not
+                # break the bunch chain, the error is raised in the producer
+                self._writer_error = e
+            finally:
+                self._write_queue.task_done()
+
+    def _raise_writer_error(self):
+        # A failed background write leaves the file incomplete, so the
+        # error is raised by every following write, flush and close
+        if self._writer_error is not None:
+            raise self._writer_error
+
+    def sync(self):
+        """Waits until all bunches handed to the writer thread are written."""
         self.flush()
-        self._file.close()
+        if self._write_queue is not None:
+            self._write_queue.join()
+        self._raise_writer_error()
+
+    def close(self):
+        try:
+            self.sync()
+            if (
+                self.persist_index
+                and self.filename is not None
+                and not self._index_pending
+            ):
+                self.save_index()
+        finally:
+            if self._writer is not None:
+                self._write_queue.put(None)
+                self._writer.join()
+                self._writer = None
+                self._write_queue = None
+            self._bunch_buffer.drop(self._buffer_owner)
+            if self._mmap is not None:
+                self._view.release()
+                try:
+                    self._mmap.close()
+                except BufferError:
+                    # Views returned by `read_at` are still alive, the mapping
+                    # is released when they are garbage collected
+                    pass
+                self._mmap = None
+                self._view = None
+            self._file.close()
+
+    def _index_filename(self):
+        if self.filename is None:
+            return None
+        return str(self.filename) + ".idx"
+
+    def save_index(self, path: str = None):
+        """Writes the index of the file to a sidecar file (by default
+        `<filename>.idx`) which is used to open the file without scanning
+        all bunch trailers. A stale sidecar file is ignored when the file is
+        opened.
+
+        Args:
+            path (str, optional): path to the index file
+        """
+        if self._index_pending:
+            self._build_index()
+        self.sync()
+        path = path or self._index_filename()
+        if path is None:
+            raise ValueError("No index file path given for a custom stream")
+        if len(self._bunch_ids) == 0:
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._pack_index())
+        os.replace(tmp_path, path)
+
+    def _last_trailer_header(self, filesize: int):
+        self._check_process()
+        with self._io_lock:
+            last_bt_fp = self._get_last_bunch_trailer(filesize)
+            self._file.seek(last_bt_fp)
+            return last_bt_fp, self._file.read(self._bunch_trailer_header.size)
 
-    def _get_last_bunch_trailer(self, pos_end):
+    def _pack_index(self) -> bytes:
+        filesize = self._indexed_size
+        last_bt_fp, last_bt = self._last_trailer_header(filesize)
+        bunches = np.empty(len(self._bunch_ids), dtype=self._index_bunch_dtype)
+        for i, k in enumerate(self._bunch_ids):
+            bt = self._rawindex[k]
+            bunches[i] = (
+                k.file_n,
+                k.bunch_n,
+                bt.bunchoff,
+                bt.dataoff,
+                bt.fileoff,
+                bt.ndata,
+                bt.flags,
+                bt.timestamp,
+            )
+        data = bytearray(
+            self._index_file_header.pack(
+                b"ICFX",
+                self._index_file_version,
+                0,
+                filesize,
+                last_bt_fp,
+                len(self._file_index),
+                len(bunches),
+                len(self._index),
+            )
+        )
+        data.extend(last_bt)
+        data.extend(np.array(self._file_index, dtype="<u8").tobytes())
+        data.extend(bunches.tobytes())
+        data.extend(self._index.sizes.astype("<u4").tobytes())
+        return data
+
+    def _load_index_file(self):
+        """Loads the persisted index from the sidecar file if it exists
+        and is up to date with the file.
+
+        Returns:
+            tuple or None: file index and raw bunch index or None
+        """
+        path = self._index_filename()
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        return self._unpack_index(data)
+
+    def _unpack_index(self, data: bytes):
+        hsize = self._index_file_header.size
+        if len(data) < hsize:
+            return None
+        (
+            magic,
+            version,
+            _,
+            filesize,
+            last_bt_fp,
+            n_files,
+            n_bunches,
+            n_objects,
+        ) = self._index_file_header.unpack(data[:hsize])
+        if magic != b"ICFX" or version != self._index_file_version:
+            return None
+        # Check that the index is not stale
+        if filesize != self.filesize:
+            return None
+        pos = hsize + self._bunch_trailer_header.size
+        if self._last_trailer_header(filesize) != (last_bt_fp, data[hsize:pos]):
+            return None
+
+        nbytes = n_files * 8 + n_bunches * self._index_bunch_dtype.itemsize
+        if len(data) != pos + nbytes + n_objects * 4:
+            return None
+        file_index = np.frombuffer(data, "<u8", n_files, pos)
+        pos += file_index.nbytes
+        bunches = np.frombuffer(data, self._index_bunch_dtype, n_bunches, pos)
+        pos += bunches.nbytes
+        sizes = np.frombuffer(data, "<u4", n_objects, pos)
+
+        rawindex = {}
+        starts = np.cumsum(bunches["ndata"], dtype=np.int64) - bunches["ndata"]
+        for b, start in zip(bunches, starts):
+            objsizes = sizes[start : start + b["ndata"]]
+            offsets = np.zeros(len(objsizes), dtype=np.uint64)
+            np.cumsum(objsizes[:-1], out=offsets[1:])
+            rawindex[self._BunchID(int(b["file_n"]), int(b["bunch_n"]))] = (
+                self._BunchTrailer(
+                    int(b["bunchoff"]),
+                    int(b["dataoff"]),
+                    int(b["fileoff"]),
+                    int(b["dataoff"]),
+                    int(b["ndata"]),
+                    offsets,
+                    objsizes,
+                    int(b["bunch_n"]),
+                    int(b["timestamp"]),
+                    int(b["flags"]),
+                )
+            )
+        return [int(fp) for fp in file_index], rawindex
+
+    def _get_last_bunch_trailer(self, pos_end, stream=None):
         # We find the last bunch trailer by reading the last 4 bytes which
         # encodes the offset to said bunch trailer
-        self._file.seek(pos_end - 4)
-        bt_start_offset = struct.unpack("<I", self._file.read(4))[0]
+        stream = stream or self._file
+        stream.seek(pos_end - 4)
+        bt_start_offset = struct.unpack("<I", stream.read(4))[0]
         current_bt_fp = pos_end - 4 - bt_start_offset
         return current_bt_fp
 
-    def _read_bunch_trailer(self):
-        last_bunch_trailer = self._file.read(self._bunch_trailer_header.size)
+    def _read_bunch_trailer(self, read_index: bool = True, stream=None):
+        stream = stream or self._file
+        last_bunch_trailer = stream.read(self._bunch_trailer_header.size)
         (
             version,
             _,
@@ -227,17 +782,24 @@ class ICFFile:
             flags,
         ) = self._bunch_trailer_header.unpack(last_bunch_trailer)
 
-        index = struct.unpack("<{}I".format(ndata), self._file.read(ndata * 4))
-        objsizes = np.array(index, dtype=np.uint32)
+        if read_index:
+            objsizes = np.frombuffer(stream.read(ndata * 4), dtype="<u4")
+            offsets = np.zeros(ndata, dtype=np.uint64)
+            np.cumsum(objsizes[:-1], out=offsets[1:])
+        else:
+            # The object table is read when needed (see `_read_bunch_sizes`)
+            objsizes = offsets = None
         return self._BunchTrailer(
             bunchoff,  # Offset to earlier bunch or file header if first bunch
             dataoff,  # Offset to beginning of data in bunch
             fileoff,  # Offset to beginning of file
             dataoff,  # Size of data bunch
             ndata,  # number of objects in bunch
-            [0] + list(np.cumsum(objsizes[:-1])),  # Object offsets in bunch
+            offsets,  # Object offsets in bunch
             objsizes,  # object sizes
             bunch_n,  # bunch number (in sub file)
+            timestamp,  # time when the bunch was written
+            flags,  # bunch flags
         )
 
     def _scan_file(self):
@@ -248,62 +810,569 @@ class ICFFile:
         while current_bt_fp > 0:
             current_bt_fp = self._get_last_bunch_trailer(current_bt_fp)
             self._file.seek(current_bt_fp)
-            bt = self._read_bunch_trailer()
+            bt = self._read_bunch_trailer(read_index=False)
             current_bt_fp -= bt.fileoff
             rev_file_index.append(current_bt_fp)
         self._file_index = list(reversed(rev_file_index))
 
         # Scan each sub file
+        file_ends = self._file_index[1:] + [self.filesize]
+        sub_files = list(zip(range(len(file_ends)), self._file_index, file_ends))
         raw_index = {}
-        for i, file_start in enumerate(self._file_index):
-            if i == len(self._file_index) - 1:
-                file_end = self.filesize
-            else:
-                file_end = self._file_index[i + 1]
-            raw_index.update(self._scan_sub_file(file_start, file_end, file_index=i))
+        workers = self._scan_workers or os.cpu_count() or 1
+        if workers > 1 and len(sub_files) > 1 and self.filename is not None:
+            # The sub files are scanned concurrently, each with its own file
+            # handle, and merged in order
+            with ThreadPoolExecutor(min(workers, len(sub_files))) as pool:
+                for sub_index in pool.map(
+                    lambda args: self._scan_sub_file_path(*args), sub_files
+                ):
+                    raw_index.update(sub_index)
+        else:
+            for i, file_start, file_end in sub_files:
+                raw_index.update(
+                    self._scan_sub_file(file_start, file_end, file_index=i)
+                )
         return raw_index
 
-    def _scan_sub_file(self, pos_start, pos_end, file_index=0):
-        current_bt_fp = self._get_last_bunch_trailer(pos_end)
-        self._file.seek(current_bt_fp)
+    def _scan_sub_file_path(self, file_index, pos_start, pos_end):
+        with open(self.filename, "rb") as stream:
+            return self._scan_sub_file(pos_start, pos_end, file_index, stream)
+
+    def _scan_sub_file(self, pos_start, pos_end, file_index=0, stream=None):
+        stream = stream or self._file
+        current_bt_fp = self._get_last_bunch_trailer(pos_end, stream)
+        stream.seek(current_bt_fp)
         rawindex = {}
         curr_bunch = 1
-        while self._file.tell() >= pos_start and curr_bunch > 0:
+        while stream.tell() >= pos_start and curr_bunch > 0:
             # read bunch trailer
-            bt = self._read_bunch_trailer()
+            bt = self._read_bunch_trailer(not self._lazy_index, stream)
 
             curr_bunch = bt.bunch_n
             rawindex[self._BunchID(file_index, bt.bunch_n)] = bt
             current_bt_fp -= bt.bunchoff
-            self._file.seek(current_bt_fp)
+            stream.seek(current_bt_fp)
 
         return rawindex
 
-    def _construct_file_index(self, rawindex):
+    def refresh(self) -> int:
+        """Indexes the bunches that were appended to the file, for instance by
+        another process, since the file was opened or last refreshed. Only
+        the trailers of the new bunches are read. A bunch that is still
+        being written is left for a later refresh.
 
+        Returns:
+            int: the number of new objects
+        """
+        self._check_process()
+        if self._index_pending:
+            self._build_index()
+        with self._io_lock:
+            filesize = self.get_file_size()
+            new_bunches = self._scan_appended(filesize)
+            if len(new_bunches) == 0:
+                return 0
+            n_entries = self.n_entries
+            for bt_fp, bt in reversed(new_bunches):
+                if bt.bunch_n == 0 and bt_fp - bt.fileoff != self._file_index[-1]:
+                    # First bunch of a new sub file
+                    self._file_index.append(bt_fp - bt.fileoff)
+                bunch_id = self._BunchID(len(self._file_index) - 1, bt.bunch_n)
+                self._rawindex[bunch_id] = bt
+                self._bunch_index[bunch_id] = self._BunchOffset(
+                    bt.fileoff - bt.dataoff, bt.bunchsize, bt.flags & CODEC_MASK
+                )
+                self._index.extend(
+                    np.full(bt.ndata, len(self._bunch_ids), dtype=np.uint32),
+                    bt.index,
+                    bt.objsize,
+                )
+                self._bunch_ids.append(bunch_id)
+            self.n_entries = len(self._index)
+            self._indexed_size = filesize
+            if self._mmap is not None:
+                # The mapping is extended to the new end of the file
+                self._view.release()
+                try:
+                    self._mmap.close()
+                except BufferError:
+                    # Views returned by `read_at` keep the old mapping alive
+                    pass
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+            return self.n_entries - n_entries
+
+    def _scan_appended(self, filesize: int) -> list:
+        # Follows the trailer chain back from the end of the file to the end
+        # of the indexed part. Returns the (position, trailer) of the new
+        # bunches, last bunch first, or an empty list if the file ends with
+        # an incomplete bunch. The end of a file that is being written can
+        # hold any bytes, so every trailer is checked against the position
+        # of the end of the trailer before it is used.
+        new_bunches = []
+        pos = filesize
+        while pos > self._indexed_size:
+            trailer = self._check_trailer(self._indexed_size, pos)
+            if trailer is None:
+                return []
+            new_bunches.append(trailer)
+            bt_fp, bt = trailer
+            pos = bt_fp - bt.dataoff
+            if pos != self._indexed_size and bt.bunch_n == 0:
+                # Continue before the header of the sub file
+                pos = bt_fp - bt.fileoff
+        if pos != self._indexed_size:
+            return []
+        return new_bunches
+
+    def _check_trailer(self, pos_start: int, pos_end: int, read_index: bool = True):
+        # Reads the bunch trailer that ends at `pos_end`. Returns its
+        # (position, trailer) or None if the offset pointer and the size of
+        # the trailer do not agree with `pos_end` or the trailer starts
+        # before `pos_start`.
+        header_size = self._bunch_trailer_header.size
+        if pos_end - 4 < pos_start:
+            return None
+        try:
+            bt_fp = self._get_last_bunch_trailer(pos_end)
+            if bt_fp < pos_start or bt_fp + header_size > pos_end - 4:
+                return None
+            self._file.seek(bt_fp)
+            bt = self._read_bunch_trailer(read_index=False)
+            n_times = bt.ndata if bt.flags & self._record_timestamps_flag else 0
+            trailer_end = bt_fp + header_size + 4 * bt.ndata + 8 * n_times
+            if trailer_end + 4 != pos_end:
+                return None
+            if read_index:
+                # The trailer is complete, read the object table
+                self._file.seek(bt_fp)
+                bt = self._read_bunch_trailer()
+                if len(bt.objsize) != bt.ndata:
+                    return None
+        except (struct.error, ValueError):
+            # A short read, the file is being written or truncated
+            return None
+        return bt_fp, bt
+
+    def _complete_size(self, pos_start: int, pos_end: int) -> int:
+        # Returns the end of the last complete bunch of a file that has its
+        # first bunch at `pos_start`. If the file does not end with a
+        # trailer the positions before `pos_end` are searched, a block at a
+        # time, for the end of a trailer of a bunch that starts after
+        # `pos_start`.
+        def complete(pos):
+            trailer = self._check_trailer(pos_start, pos, read_index=False)
+            return trailer is not None and trailer[0] - trailer[1].dataoff >= pos_start
+
+        if pos_end == pos_start or complete(pos_end):
+            return pos_end
+        block = 1 << 20
+        hi = pos_end - 1
+        while hi >= pos_start + 4:
+            lo = max(pos_start + 4, hi - block)
+            self._file.seek(lo - 4)
+            buf = self._file.read(hi - lo + 4)
+            # The offset pointer in the 4 bytes before each possible end
+            pointers = np.ndarray((len(buf) - 3,), "<u4", buf, 0, (1,))
+            ends = np.arange(lo, lo + len(pointers))
+            candidates = ends[
+                (pointers >= self._bunch_trailer_header.size)
+                & (ends - 4 - pointers.astype(np.int64) >= pos_start)
+            ]
+            for pos in candidates[::-1].tolist():
+                if complete(pos):
+                    return pos
+            hi = lo - 1
+        return pos_start
+
+    def follow(self, start: int = 0, poll_interval: float = 1.0, timeout: float = None):
+        """Yields the objects in the file from index `start` and then the
+        objects appended to the file while it is followed, checking for new
+        bunches with `refresh` every `poll_interval` seconds.
+
+        Args:
+            start (int, optional): index of the first object
+            poll_interval (float, optional): time between checks for new bunches in seconds
+            timeout (float, optional): stop after `timeout` seconds without new objects, by default never
+
+        Yields:
+            bytes: the objects in the file
+        """
+        next_index = start
+        last_new = time.monotonic()
+        while True:
+            while next_index < self.n_entries:
+                stop = min(next_index + 1024, self.n_entries)
+                yield from self.read_many(np.arange(next_index, stop))
+                next_index = stop
+            if self.refresh() > 0:
+                last_new = time.monotonic()
+                continue
+            if timeout is not None and time.monotonic() - last_new >= timeout:
+                return
+            time.sleep(poll_interval)
+
+    def _construct_file_index(self, rawindex):
+        bunches, offsets, sizes = [], [], []
         for k, bunch in sorted(rawindex.items()):
             self._rawindex[k] = bunch
             self._bunch_index[k] = self._BunchOffset(
-                bunch.fileoff - bunch.dataoff, bunch.bunchsize
+                bunch.fileoff - bunch.dataoff, bunch.bunchsize, bunch.flags & CODEC_MASK
             )
-            for i, obj in enumerate(bunch.index):
-                self._index.append(
-                    self._ObjectOffset(k, int(obj), int(bunch.objsize[i]))
+            if self._lazy_index:
+                sizes.append(bunch.ndata)
+            else:
+                bunches.append(
+                    np.full(bunch.ndata, len(self._bunch_ids), dtype=np.uint32)
                 )
+                offsets.append(bunch.index)
+                sizes.append(bunch.objsize)
+            self._bunch_ids.append(k)
+        if self._lazy_index:
+            self._index = LazyObjectIndex(sizes, self._read_bunch_sizes)
+        elif len(bunches) > 0:
+            self._index.extend(
+                np.concatenate(bunches), np.concatenate(offsets), np.concatenate(sizes)
+            )
         self.n_entries = len(self._index)
 
+    def _continue_bunch_chain(self):
+        # New bunches continue the numbering and the trailer chain of the
+        # last sub file
+        if len(self._bunch_ids) == 0:
+            return
+        bunch_id = self._bunch_ids[-1]
+        if bunch_id.file_n == len(self._file_index) - 1:
+            self._bunch_number = bunch_id.bunch_n + 1
+            self._last_bunch_fp = (
+                self._file_index[-1] + self._rawindex[bunch_id].fileoff
+            )
+
+    def _build_index(self):
+        # Builds the index of a file opened in "append_only" mode the first
+        # time it is read. The bunches written so far are flushed and the
+        # whole file is scanned.
+        self.sync()
+        with self._io_lock:
+            self._index_pending = False
+            self._bunch_buffer.drop(self._buffer_owner)
+            self._index = ObjectIndex()
+            self._bunch_ids = []
+            self._bunch_index = {}
+            self._rawindex = {}
+            self._record_times = {}
+            self.get_file_size()
+            self._construct_file_index(self._scan_file())
+            self._indexed_size = self.filesize
+
+    def _read_bunch_sizes(self, bunch_n: int, cache: bool = True) -> np.ndarray:
+        # Returns the object sizes of a bunch, reading the object table of
+        # the bunch trailer if it was not read when the file was opened
+        bunch_id = self._bunch_ids[bunch_n]
+        bt = self._rawindex[bunch_id]
+        if bt.objsize is None:
+            pos = (
+                self._file_index[bunch_id.file_n]
+                + bt.fileoff
+                + self._bunch_trailer_header.size
+            )
+            objsizes = np.frombuffer(self._read_raw(pos, bt.ndata * 4), dtype="<u4")
+            if not cache:
+                return objsizes
+            offsets = np.zeros(bt.ndata, dtype=np.uint64)
+            np.cumsum(objsizes[:-1], out=offsets[1:])
+            bt = bt._replace(index=offsets, objsize=objsizes)
+            self._rawindex[bunch_id] = bt
+        return bt.objsize
+
+    def _read_raw(self, pos: int, size: int):
+        self._check_process()
+        if self._view is not None:
+            if self._stats is not None:
+                self._record("bytes_read", size)
+            return self._view[pos : pos + size]
+        with self._io_lock:
+            if self._stats is not None:
+                self._record("seeks", 1)
+                self._record("bytes_read", size)
+            self._file.seek(pos)
+            return self._file.read(size)
+
+    def _get_codec(self, codec_id: int):
+        if codec_id not in self._codecs:
+            self._codecs[codec_id] = get_codec(codec_id)
+        return self._codecs[codec_id]
+
+    def _load_bunch(self, bunch_id):
+        # Reads and decompresses a bunch without touching the bunch buffer,
+        # which makes it safe to call from worker threads
+        if self._stats is not None:
+            self._record("bunch_loads", 1)
+        bunch_offset = self._bunch_index[bunch_id]
+        bunch = self._read_raw(
+            self._file_index[bunch_id.file_n] + bunch_offset.offset,
+            bunch_offset.size,
+        )
+        if bunch_offset.codec != 0:
+            bunch = self._get_codec(bunch_offset.codec).decompress(bunch)
+            if self._view is not None:
+                bunch = memoryview(bunch)
+        return bunch
+
     def _get_bunch(self, bunch_id):
-        if bunch_id in self._bunch_buffer:
-            return self._bunch_buffer[bunch_id]
-        else:
-            self._file.seek(
+        bunch = self._buffered_bunch(bunch_id)
+        if bunch is None:
+            bunch = self._read_bunch(bunch_id)
+        return bunch
+
+    def _buffered_bunch(self, bunch_id):
+        # Returns the bunch if it is in the bunch buffer, otherwise None
+        bunch = self._bunch_buffer.get((self._buffer_owner, bunch_id))
+        if bunch is not None and self._stats is not None:
+            self._record("buffer_hits", 1)
+        return bunch
+
+    def _read_bunch(self, bunch_id):
+        # Loads a bunch and adds it to the bunch buffer
+        bunch = self._load_bunch(bunch_id)
+        if self._view is not None and self._bunch_index[bunch_id].codec == 0:
+            # A memory mapped bunch is already cached by the OS
+            return bunch
+        self._bunch_buffer[(self._buffer_owner, bunch_id)] = bunch
+        return bunch
+
+    def _get_bunches(self, bunch_numbers) -> dict:
+        """Returns the bunches with the given (global) bunch numbers. Bunches
+        that are not in the bunch buffer and lie next to each other in the
+        file are read with a single read.
+
+        Args:
+            bunch_numbers (iterable): sorted unique bunch numbers
+
+        Returns:
+            dict: bunch number to bunch
+        """
+        bunches = {}
+        runs = []
+        for bunch_n in bunch_numbers:
+            bunch_id = self._bunch_ids[bunch_n]
+            if (
+                self._view is not None
+                or (self._buffer_owner, bunch_id) in self._bunch_buffer
+            ):
+                bunches[bunch_n] = self._get_bunch(bunch_id)
+                continue
+            start = (
                 self._file_index[bunch_id.file_n] + self._bunch_index[bunch_id].offset
             )
-            # bunch = self._compressor.decompress(
-            bunch = self._file.read(self._bunch_index[bunch_id].size)
-            # )
-            self._bunch_buffer[bunch_id] = bunch
-            return bunch
+            stop = start + self._bunch_index[bunch_id].size
+            if (
+                len(runs) > 0
+                and 0 <= start - runs[-1][1] <= self._max_read_gap
+                and stop - runs[-1][0] <= self._max_read_size
+            ):
+                runs[-1][1] = stop
+                runs[-1][2].append((bunch_n, start))
+            else:
+                runs.append([start, stop, [(bunch_n, start)]])
+
+        for run_start, run_stop, members in runs:
+            data = self._read_raw(run_start, run_stop - run_start)
+            for bunch_n, start in members:
+                bunch_id = self._bunch_ids[bunch_n]
+                bunch_offset = self._bunch_index[bunch_id]
+                pos = start - run_start
+                bunch = data[pos : pos + bunch_offset.size]
+                if bunch_offset.codec != 0:
+                    bunch = self._get_codec(bunch_offset.codec).decompress(bunch)
+                self._bunch_buffer.misses += 1
+                if self._stats is not None:
+                    self._record("bunch_loads", 1)
+                self._bunch_buffer[(self._buffer_owner, bunch_id)] = bunch
+                bunches[bunch_n] = bunch
+        return bunches
+
+    def read_many(self, indices) -> list:
+        """Reads the objects at the given indices. The requested objects are
+        grouped by bunch so that each bunch is read only once and bunches
+        next to each other in the file are read together.
+
+        Args:
+            indices (iterable): indices of the objects to be read
+
+        Returns:
+            list: the objects in the same order as `indices`
+
+        Raises:
+            IndexError: if an index is out of range
+        """
+        self._check_process()
+        if self._index_pending:
+            self._build_index()
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + self.n_entries, indices)
+        if len(indices) > 0 and (
+            indices.min() < 0 or indices.max() > self.n_entries - 1
+        ):
+            raise IndexError(
+                "The requested file objects at indices ({}) are out of range".format(
+                    indices[(indices < 0) | (indices > self.n_entries - 1)]
+                )
+            )
+        bunch_numbers, offsets, sizes = self._index.lookup(indices)
+        bunches = self._get_bunches(np.unique(bunch_numbers).tolist())
+        return [
+            bunches[b][o : o + s]
+            for b, o, s in zip(bunch_numbers.tolist(), offsets.tolist(), sizes.tolist())
+        ]
+
+    def _read_record_times(self, bunch_n: int) -> np.ndarray:
+        # Returns the object timestamps (ns) of a bunch, or None if the
+        # bunch was written without them
+        bunch_id = self._bunch_ids[bunch_n]
+        if bunch_n == len(self._bunch_ids) - 1 and len(self._cbunchindex) > 0:
+            # The bunch that is being written
+            if not self.record_timestamps:
+                return None
+            return np.array(self._cbunchtimes, dtype=np.uint64)
+        if bunch_id in self._record_times:
+            # A flushed bunch that is waiting to be written
+            return self._record_times[bunch_id]
+        bt = self._rawindex[bunch_id]
+        if not bt.flags & self._record_timestamps_flag:
+            return None
+        pos = (
+            self._file_index[bunch_id.file_n]
+            + bt.fileoff
+            + self._bunch_trailer_header.size
+            + bt.ndata * 4
+        )
+        return np.frombuffer(self._read_raw(pos, bt.ndata * 8), dtype="<u8")
+
+    def time_range_indices(self, t0, t1) -> np.ndarray:
+        """Returns the indices of the objects written between `t0` and `t1`.
+
+        The bunches that can hold such objects are found from the time each
+        bunch was written, with a binary search when the bunch timestamps
+        are ordered. Within a bunch the objects are selected by their own
+        timestamp if the file was written with `record_timestamps=True`,
+        otherwise all objects of the bunch are returned. Bunch timestamps
+        have a resolution of one second.
+
+        Args:
+            t0 (Union[datetime, float]): start time (unix time in seconds)
+            t1 (Union[datetime, float]): end time (unix time in seconds)
+
+        Returns:
+            np.ndarray: indices of the objects
+        """
+        self._check_process()
+        if self._index_pending:
+            self._build_index()
+        t0 = t0.timestamp() if isinstance(t0, datetime) else float(t0)
+        t1 = t1.timestamp() if isinstance(t1, datetime) else float(t1)
+        n_bunches = len(self._bunch_ids)
+        # Bunches that are not written yet get an infinite timestamp
+        timestamps = np.array(
+            [
+                self._rawindex[k].timestamp if k in self._rawindex else np.inf
+                for k in self._bunch_ids
+            ],
+            dtype=np.float64,
+        )
+        # A bunch holds the objects written after the previous bunch of the
+        # same sub file and before its own (truncated) timestamp
+        written = timestamps[np.isfinite(timestamps)]
+        if len(self._file_index) == 1 and np.all(np.diff(written) >= 0):
+            first = np.searchsorted(timestamps, math.floor(t0), side="left")
+            last = min(np.searchsorted(timestamps, t1, side="right"), n_bunches - 1)
+            candidates = range(first, last + 1)
+        else:
+            previous = np.concatenate([[-np.inf], timestamps[:-1]])
+            file_n = np.array([k.file_n for k in self._bunch_ids])
+            previous[1:][file_n[1:] != file_n[:-1]] = -np.inf
+            # No lower bound after a bunch that is not written yet
+            previous[previous == np.inf] = -np.inf
+            candidates = np.flatnonzero(
+                (timestamps >= math.floor(t0)) & (previous <= t1)
+            ).tolist()
+
+        starts = self._index.bunch_starts(n_bunches)
+        indices = []
+        for bunch_n in candidates:
+            bunch_indices = np.arange(starts[bunch_n], starts[bunch_n + 1])
+            times = self._read_record_times(bunch_n)
+            if times is not None:
+                bunch_indices = bunch_indices[(times >= t0 * 1e9) & (times <= t1 * 1e9)]
+            indices.append(bunch_indices)
+        if len(indices) == 0:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(indices)
+
+    def time_range(self, t0, t1) -> list:
+        """Reads the objects written between `t0` and `t1`, see
+        `time_range_indices`.
+
+        Args:
+            t0 (Union[datetime, float]): start time (unix time in seconds)
+            t1 (Union[datetime, float]): end time (unix time in seconds)
+
+        Returns:
+            list: the objects in file order
+        """
+        return self.read_many(self.time_range_indices(t0, t1))
+
+    def __iter__(self):
+        return self.iter(prefetch=0)
+
+    def iter(self, prefetch: int = 4, workers: int = 2, cache_index: bool = True):
+        """Iterates over all objects in the file in order.
+
+        The next `prefetch` bunches are read and decompressed in a pool
+        of `workers` threads while the objects of the current bunch are
+        consumed, which overlaps I/O and decompression with the work done
+        by the caller. Prefetched bunches bypass the bunch buffer.
+
+        Args:
+            prefetch (int, optional): number of bunches to read ahead, 0 to read on the calling thread
+            workers (int, optional): number of threads used to read and decode bunches
+            cache_index (bool, optional): keep the object tables read by a lazy index, False to stream the file in bounded memory
+
+        Yields:
+            bytes: the objects in the file
+        """
+        self._check_process()
+        if self._index_pending:
+            self._build_index()
+        n_bunches = len(self._bunch_ids)
+        pool = ThreadPoolExecutor(workers) if prefetch > 0 else None
+        pending = deque()
+        next_bunch = 0
+        try:
+            for bunch_n in range(n_bunches):
+                while next_bunch < n_bunches and len(pending) <= prefetch:
+                    bunch_id = self._bunch_ids[next_bunch]
+                    if (
+                        pool is None
+                        or (self._buffer_owner, bunch_id) in self._bunch_buffer
+                    ):
+                        pending.append(self._get_bunch(bunch_id))
+                    else:
+                        pending.append(pool.submit(self._load_bunch, bunch_id))
+                    next_bunch += 1
+                bunch = pending.popleft()
+                if isinstance(bunch, Future):
+                    bunch = bunch.result()
+                offsets, sizes = self._index.bunch_entries(bunch_n, cache_index)
+                for offset, size in zip(offsets.tolist(), sizes.tolist()):
+                    yield bunch[offset : offset + size]
+        finally:
+            if pool is not None:
+                for f in pending:
+                    if isinstance(f, Future):
+                        f.cancel()
+                pool.shutdown()
 
     def read_at(self, ind: int) -> bytes:
         """Reads one object at the index indicated by `ind`
@@ -312,12 +1381,15 @@ class ICFFile:
             ind (int): the index of the object to be read
 
         Returns:
-            bytes: that represent the object
+            bytes: that represent the object (a `memoryview` over the
+                   mapped file when opened with `use_mmap=True`)
 
         Raises:
             IndexError: if index out of range
         """
-
+        self._check_process()
+        if self._index_pending:
+            self._build_index()
         if ind > self.n_entries - 1:
             raise IndexError(
                 "The requested file object at index ({}) is out of range".format(ind)
@@ -325,7 +1397,7 @@ class ICFFile:
         obji = self._index[ind]
         if True:  # self._compressed:
 
-            bunch = self._get_bunch(obji.bunch_id)
+            bunch = self._get_bunch(self._bunch_ids[obji.bunch_id])
             return bunch[obji.offset : obji.offset + obji.size]
         # else:
         #     fpos = self.file_index[obji[0][0]] + self._bunch_index[obji[0]][0] + obji[1]
@@ -356,34 +1428,285 @@ class ICFFile:
         return s
 
     def size(self):
+        if self._index_pending:
+            self._build_index()
         return self.n_entries
 
 
-class BunchBuffer(dict):
-    def __init__(self, size):
+class ObjectIndex:
+    """Compact index of the objects stored in a file.
+
+    The index is kept as three parallel numpy arrays holding, for each object,
+    the (global) number of the bunch it is stored in, the offset of the object
+    within the bunch and the size of the object. The arrays grow geometrically
+    so that appending single objects stays cheap.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._bunch = np.empty(capacity, dtype=np.uint32)
+        self._offset = np.empty(capacity, dtype=np.uint64)
+        self._size = np.empty(capacity, dtype=np.uint32)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def bunches(self) -> np.ndarray:
+        return self._bunch[: self._n]
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self._offset[: self._n]
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return self._size[: self._n]
+
+    def _reserve(self, n: int):
+        if n <= len(self._bunch):
+            return
+        capacity = max(n, 2 * len(self._bunch))
+        for attr in ("_bunch", "_offset", "_size"):
+            old = getattr(self, attr)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[: self._n] = old[: self._n]
+            setattr(self, attr, new)
+
+    def append(self, bunch: int, offset: int, size: int):
+        self._reserve(self._n + 1)
+        self._bunch[self._n] = bunch
+        self._offset[self._n] = offset
+        self._size[self._n] = size
+        self._n += 1
+
+    def extend(self, bunches, offsets, sizes):
+        n = len(sizes)
+        self._reserve(self._n + n)
+        self._bunch[self._n : self._n + n] = bunches
+        self._offset[self._n : self._n + n] = offsets
+        self._size[self._n : self._n + n] = sizes
+        self._n += n
+
+    def bunch_starts(self, n_bunches: int) -> np.ndarray:
+        """Returns the index of the first object of each bunch followed
+        by the total number of objects.
+        """
+        return np.searchsorted(self.bunches, np.arange(n_bunches + 1))
+
+    def lookup(self, indices: np.ndarray):
+        """Returns the bunch numbers, offsets and sizes of the objects at
+        the given (non-negative) indices.
+        """
+        return self.bunches[indices], self.offsets[indices], self.sizes[indices]
+
+    def bunch_entries(self, bunch: int, cache: bool = True):
+        """Returns the offsets and sizes of the objects in a bunch.
+        All entries are held in memory, `cache` has no effect."""
+        start, stop = np.searchsorted(self.bunches, [bunch, bunch + 1])
+        return self.offsets[start:stop], self.sizes[start:stop]
+
+    def __getitem__(self, ind: int):
+        if ind < 0:
+            ind += self._n
+        if ind < 0 or ind >= self._n:
+            raise IndexError("object index out of range")
+        return ICFFile._ObjectOffset(
+            int(self._bunch[ind]), int(self._offset[ind]), int(self._size[ind])
+        )
+
+
+class LazyObjectIndex:
+    """Object index that only keeps the number of objects per bunch for the
+    bunches found when the file was opened.
+
+    The bunch of an object is found with a binary search in the cumulative
+    object counts and the offsets and sizes of the objects in a bunch are
+    loaded the first time the bunch is accessed. Objects written after the
+    file was opened are kept in an `ObjectIndex`.
+    """
+
+    def __init__(self, counts, load_sizes):
+        self._starts = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._starts[1:])
+        self._n_bunches = len(counts)
+        self._n_lazy = int(self._starts[-1])
+        self._load_sizes = load_sizes
+        self._loaded = {}
+        self._tail = ObjectIndex()
+
+    def __len__(self):
+        return self._n_lazy + len(self._tail)
+
+    def _entries(self, bunch: int, cache: bool = True):
+        entries = self._loaded.get(bunch)
+        if entries is None:
+            sizes = self._load_sizes(bunch, cache)
+            offsets = np.zeros(len(sizes), dtype=np.uint64)
+            np.cumsum(sizes[:-1], out=offsets[1:])
+            entries = (offsets, sizes)
+            if cache:
+                self._loaded[bunch] = entries
+        return entries
+
+    @property
+    def bunches(self) -> np.ndarray:
+        return self.lookup(np.arange(len(self)))[0]
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self.lookup(np.arange(len(self)))[1]
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return self.lookup(np.arange(len(self)))[2]
+
+    def append(self, bunch: int, offset: int, size: int):
+        self._tail.append(bunch, offset, size)
+
+    def extend(self, bunches, offsets, sizes):
+        self._tail.extend(bunches, offsets, sizes)
+
+    def lookup(self, indices: np.ndarray):
+        indices = np.asarray(indices, dtype=np.int64)
+        bunches = np.empty(len(indices), dtype=np.uint32)
+        offsets = np.empty(len(indices), dtype=np.uint64)
+        sizes = np.empty(len(indices), dtype=np.uint32)
+
+        tail = indices >= self._n_lazy
+        if tail.any():
+            bunches[tail], offsets[tail], sizes[tail] = self._tail.lookup(
+                indices[tail] - self._n_lazy
+            )
+        lazy = ~tail
+        indices = indices[lazy]
+        bunch_n = np.searchsorted(self._starts, indices, side="right") - 1
+        unique, inverse = np.unique(bunch_n, return_inverse=True)
+        if len(unique) > 0:
+            # Gather the entries of the accessed bunches in one array each
+            entries = [self._entries(b) for b in unique.tolist()]
+            first = np.cumsum([0] + [len(e[1]) for e in entries[:-1]])
+            pos = first[inverse] + (indices - self._starts[bunch_n])
+            offsets[lazy] = np.concatenate([e[0] for e in entries])[pos]
+            sizes[lazy] = np.concatenate([e[1] for e in entries])[pos]
+        bunches[lazy] = bunch_n
+        return bunches, offsets, sizes
+
+    def bunch_starts(self, n_bunches: int) -> np.ndarray:
+        tail_starts = self._tail.bunch_starts(n_bunches)[self._n_bunches :]
+        return np.concatenate([self._starts[:-1], self._n_lazy + tail_starts])
+
+    def bunch_entries(self, bunch: int, cache: bool = True):
+        """Returns the offsets and sizes of the objects in a bunch. With
+        `cache` False the entries of a bunch that has not been accessed
+        before are read but not kept."""
+        if bunch < self._n_bunches:
+            return self._entries(bunch, cache)
+        return self._tail.bunch_entries(bunch)
+
+    def __getitem__(self, ind: int):
+        if ind < 0:
+            ind += len(self)
+        if ind < 0 or ind >= len(self):
+            raise IndexError("object index out of range")
+        if ind >= self._n_lazy:
+            return self._tail[ind - self._n_lazy]
+        bunch = int(np.searchsorted(self._starts, ind, side="right")) - 1
+        offsets, sizes = self._entries(bunch)
+        i = ind - int(self._starts[bunch])
+        return ICFFile._ObjectOffset(bunch, int(offsets[i]), int(sizes[i]))
+
+
+class BunchBuffer:
+    """Least recently used cache of (decompressed) bunches.
+
+    The buffer is bounded by the number of bunches (`size`) and/or by the
+    total number of bytes of the cached bunches (`max_bytes`). A buffer can be
+    shared between several `ICFFile` instances, in which case the files use
+    keys of the form `(owner, bunch_id)`. Bunches that are still being written
+    are pinned in the buffer, they are never evicted and do not count
+    towards the limits.
+
+    Attributes:
+        size (int): maximum number of cached bunches, `None` for no limit
+        max_bytes (int): maximum total size of the cached bunches, `None` for no limit
+        nbytes (int): current total size of the cached bunches
+        hits (int): number of lookups that found the bunch in the buffer
+        misses (int): number of lookups that did not find the bunch
+        evictions (int): number of bunches evicted from the buffer
+    """
+
+    def __init__(self, size: int = 10, max_bytes: int = None):
         self.size = size
-        self.queue = deque()
-        self.curr_wbunch = None
-        self.curr_wbunch_key = None
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bunches = OrderedDict()
+        self._pinned = {}
+        self._lock = threading.RLock()
 
-    def set_curr_wbunch(self, key, bunch):
-        self.curr_wbunch = bunch
-        self.curr_wbunch_key = key
+    def pin(self, key, bunch):
+        """Adds a bunch that is being written to the buffer."""
+        with self._lock:
+            self._pinned[key] = bunch
 
-    def __setitem__(self, key, obj):
+    def unpin(self, key):
+        with self._lock:
+            self._pinned.pop(key, None)
 
-        self.queue.append((key, obj))
-        super().__setitem__(key, obj)
-        if len(self.queue) > self.size:
-            bunch = self.queue.popleft()
-            super().pop(bunch[0])
+    def __setitem__(self, key, obj):
+        with self._lock:
+            if key in self._bunches:
+                self.nbytes -= len(self._bunches.pop(key))
+            self._bunches[key] = obj
+            self.nbytes += len(obj)
+            while len(self._bunches) > 1 and (
+                (self.size is not None and len(self._bunches) > self.size)
+                or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+            ):
+                _, bunch = self._bunches.popitem(last=False)
+                self.nbytes -= len(bunch)
+                self.evictions += 1
 
     def __contains__(self, key):
-        return super().__contains__(key) or self.curr_wbunch_key == key
+        return key in self._bunches or key in self._pinned
 
     def __getitem__(self, key):
+        with self._lock:
+            if key in self._pinned:
+                return self._pinned[key]
+            self._bunches.move_to_end(key)
+            return self._bunches[key]
 
-        if key == self.curr_wbunch_key:
-            return self.curr_wbunch
-        else:
-            return super().__getitem__(key)
+    def __len__(self):
+        return len(self._bunches)
+
+    def get(self, key, default=None):
+        """Returns the bunch at `key` if it is in the buffer, otherwise
+        `default`. Counts the lookup as a hit or a miss.
+        """
+        with self._lock:
+            if key in self:
+                self.hits += 1
+                return self[key]
+            self.misses += 1
+            return default
+
+    def drop(self, owner):
+        """Removes all bunches of `owner` from a shared buffer."""
+        with self._lock:
+            for key in [k for k in self._bunches if k[0] == owner]:
+                self.nbytes -= len(self._bunches.pop(key))
+            for key in [k for k in self._pinned if k[0] == owner]:
+                del self._pinned[key]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "nbunches": len(self._bunches),
+            "nbytes": self.nbytes,
+        }
@@ -0,0 +1,71 @@
+"""Processing of the objects in an icf file with a pool of processes"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+
+# The file and function of a worker process, set by `_init_worker`
+_worker_file = None
+_worker_fn = None
+
+
+def _init_worker(icffile, fn):
+    global _worker_file, _worker_fn
+    _worker_file = icffile
+    _worker_fn = fn
+
+
+def _map_range(start: int, stop: int) -> list:
+    return [_worker_fn(obj) for obj in _worker_file.read_many(np.arange(start, stop))]
+
+
+def _split(icffile, n_chunks: int, chunks_by_bunch: bool) -> list:
+    # Splits the objects of the file in `n_chunks` ranges, along bunch
+    # boundaries if `chunks_by_bunch` so that each bunch is read by one worker
+    n = icffile.size()
+    if chunks_by_bunch:
+        starts = icffile._index.bunch_starts(len(icffile._bunch_ids))
+        # bunch boundaries closest to an even split of the objects
+        targets = np.linspace(0, n, n_chunks + 1)
+        bounds = starts[np.searchsorted(starts, targets).clip(0, len(starts) - 1)]
+    else:
+        bounds = np.linspace(0, n, n_chunks + 1).astype(np.int64)
+    bounds = np.unique(np.concatenate([[0], bounds, [n]]))
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def parallel_map(
+    fn, icffile, workers: int = None, chunks_by_bunch: bool = True, mp_context=None
+) -> list:
+    """Applies `fn` to every object in an icf file with a pool of processes.
+
+    The file is sent once to each worker, as its path and index, and each
+    worker opens its own file handle. The objects are split in ranges of
+    consecutive objects, along bunch boundaries if `chunks_by_bunch` is set
+    so that no bunch is read by more than one worker.
+
+    Args:
+        fn (callable): function applied to each object, must be picklable
+        icffile (ICFFile): file opened in read mode
+        workers (int, optional): number of processes, by default the number of CPUs
+        chunks_by_bunch (bool, optional): split the objects along bunch boundaries
+        mp_context (optional): multiprocessing context used to start the processes
+
+    Returns:
+        list: `fn` applied to the objects in the order of the objects in the file
+    """
+    workers = workers or os.cpu_count() or 1
+    # A few chunks per worker to balance the load
+    chunks = _split(icffile, workers * 4, chunks_by_bunch)
+    if len(chunks) == 0:
+        return []
+    results = []
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(icffile, fn),
+    ) as pool:
+        for chunk_result in pool.map(_map_range, *zip(*chunks)):
+            results.extend(chunk_result)
+    return results
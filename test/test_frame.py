@@ -0,0 +1,192 @@
+import numpy as np
+import pytest
+from icf.frame import Frame, FrameSchema, SerializationDispatcher, read_column
+from icf.pyicf import ICFFile
+from icf.framebatch import FrameBatchWriter, FrameBatchReader
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class P(SerializationDispatcher, types=[Point]):
+    # A user defined serializer that does not take `copy`, Q stores the
+    # serializer of a list element by the first letter of its name
+    def __init__(self, obj):
+        self.point = obj
+
+    def serialize(self):
+        return "{},{}".format(self.point.x, self.point.y).encode()
+
+    @classmethod
+    def deserialize(cls, data):
+        return Point(*map(int, data.decode().split(",")))
+
+
+def make_frame():
+    frame = Frame()
+    frame["arr"] = np.arange(100, dtype=np.float64).reshape(10, 10)
+    frame["list"] = [1, 2.5, "s", b"b", (np.arange(3), 4 + 1j)]
+    frame["str"] = "a string"
+    frame["int"] = 2 ** 70
+    return frame
+
+
+def test_serialize_roundtrip():
+    frame = make_frame()
+    rframe = Frame.deserialize(frame.serialize())
+    assert set(rframe.keys()) == set(frame.keys())
+    assert np.all(rframe["arr"] == frame["arr"])
+    assert rframe["arr"].shape == (10, 10)
+    assert rframe["list"][:4] == frame["list"][:4]
+    assert np.all(rframe["list"][4][0] == np.arange(3))
+    assert rframe["list"][4][1] == 4 + 1j
+    assert rframe["str"] == "a string"
+    assert rframe["int"] == 2 ** 70
+
+
+def test_packed_sequences():
+    frame = Frame()
+    frame["ints"] = list(range(-1000, 1000))
+    frame["floats"] = tuple(float(i) / 3 for i in range(1000))
+    frame["complex"] = {1j, 2 + 3j}
+    frame["big"] = [2 ** 70, 1]
+    frame["mixed"] = [1, 2.0, "3"]
+    data = frame.serialize()
+    assert len(data) < 8 * 3000 + 1000, "Numeric sequences are packed"
+    rframe = Frame.deserialize(data)
+    for key in ["ints", "floats", "complex", "big", "mixed"]:
+        assert rframe[key] == frame[key]
+        assert type(rframe[key]) is type(frame[key])
+    assert type(rframe["ints"][0]) is int
+
+
+def test_zero_copy_deserialize():
+    data = bytearray(make_frame().serialize())
+    rframe = Frame.deserialize(data)
+    arr = rframe["arr"]
+    assert np.shares_memory(arr, np.frombuffer(data, np.uint8)), "Array is a view"
+    assert not arr.flags.writeable, "View is read-only"
+    assert np.shares_memory(
+        rframe["list"][4][0], np.frombuffer(data, np.uint8)
+    ), "Nested array is a view"
+
+    rframe = Frame.deserialize(data, copy=True)
+    arr = rframe["arr"]
+    assert not np.shares_memory(arr, np.frombuffer(data, np.uint8)), "Array is a copy"
+    assert arr.flags.writeable, "Copy is writeable"
+
+
+def test_read_column(tmp_path):
+    f = ICFFile(str(tmp_path / "frames.icf"), bunchsize=2000)
+    frames = []
+    for i in range(50):
+        frame = Frame()
+        frame["n"] = i
+        frame["randomarr"] = np.random.uniform(size=(3, 4))
+        frame["ragged"] = np.arange(i)
+        frames.append(frame)
+        f.write(frame.serialize())
+    f.close()
+
+    f = ICFFile(str(tmp_path / "frames.icf"), mode="r")
+    column = read_column(f, "randomarr")
+    assert column.shape == (50, 3, 4), "Arrays stacked"
+    assert np.all(column == np.array([frame["randomarr"] for frame in frames]))
+    column = read_column(f, "randomarr", indices=[40, 2])
+    assert np.all(column[0] == frames[40]["randomarr"])
+    ragged = read_column(f, "ragged", chunksize=7)
+    assert isinstance(ragged, list), "Arrays with different shapes in a list"
+    assert all(np.all(r == np.arange(i)) for i, r in enumerate(ragged))
+    assert read_column(f, "n") == list(range(50))
+    assert read_column(f, "missing") == [None] * 50
+
+
+def test_frame_batches(tmp_path):
+    path = str(tmp_path / "batches.icf")
+    frames = []
+    with FrameBatchWriter(ICFFile(path), batchsize=8) as writer:
+        for i in range(20):
+            frame = Frame()
+            frame["arr"] = np.full((2, 3), i, dtype=np.float64)
+            frame["ragged"] = np.arange(i)
+            if i % 3 == 0:
+                frame["sometimes"] = "frame {}".format(i)
+            frames.append(frame)
+            writer.write(frame)
+
+    reader = FrameBatchReader(ICFFile(path, mode="r"))
+    assert reader.n_batches() == 3
+    assert len(reader) == 20
+    column = reader.column("arr", 1)
+    assert column.shape == (8, 2, 3), "Column of one batch as one array"
+    assert np.all(column[:, 0, 0] == np.arange(8, 16))
+    assert reader.column("sometimes", 0) == ["frame 0", "frame 3", "frame 6"]
+    for i, frame in enumerate(reader):
+        assert np.all(frame["arr"] == frames[i]["arr"])
+        assert np.all(frame["ragged"] == frames[i]["ragged"])
+        assert frame.get("sometimes") == frames[i].get("sometimes")
+    assert np.all(reader[13]["ragged"] == np.arange(13))
+
+
+def test_frame_schema(tmp_path):
+    schema = FrameSchema.from_frame(make_frame())
+    assert FrameSchema.from_bytes(schema.to_bytes()) == schema
+
+    frame = make_frame()
+    data = frame.serialize(schema)
+    assert len(data) < len(frame.serialize()), "Schema trailer is smaller"
+    rframe = Frame.deserialize(data, schema=schema)
+    assert np.all(rframe["arr"] == frame["arr"])
+    assert rframe["str"] == "a string"
+    assert rframe["int"] == 2 ** 70
+    with pytest.raises(ValueError):
+        Frame.deserialize(data)
+
+    # Frames with key/type combinations outside the schema use the class names
+    frame["extra"] = "not in the schema"
+    rframe = Frame.deserialize(frame.serialize(schema))
+    assert rframe["extra"] == "not in the schema"
+
+    f = ICFFile(str(tmp_path / "frames.icf"), header_ext=schema.to_bytes())
+    for i in range(10):
+        frame = make_frame()
+        frame["int"] = i
+        f.write(frame.serialize(schema))
+    f.close()
+
+    f = ICFFile(str(tmp_path / "frames.icf"), mode="r")
+    schema = FrameSchema.from_bytes(f.header_ext)
+    assert Frame.deserialize(f.read_at(3), schema=schema)["int"] == 3
+    assert read_column(f, "int") == list(range(10))
+
+
+def test_user_serializer():
+    frame = Frame()
+    frame["p"] = Point(1, 2)
+    frame["ps"] = [Point(3, 4), 5]
+    for copy in [False, True]:
+        rframe = Frame.deserialize(frame.serialize(), copy=copy)
+        assert (rframe["p"].x, rframe["p"].y) == (1, 2)
+        assert (rframe["ps"][0].x, rframe["ps"][0].y) == (3, 4)
+        assert rframe["ps"][1] == 5
+
+
+def test_pickle_deserialized_frame():
+    import pickle
+
+    data = bytearray(make_frame().serialize())
+    for copy in [False, True]:
+        rframe = Frame.deserialize(data, copy=copy)
+        rframe["str"]
+        rframe = pickle.loads(pickle.dumps(rframe))
+        assert np.all(rframe["arr"] == make_frame()["arr"])
+        assert rframe["str"] == "a string"
+        assert rframe["list"][:4] == make_frame()["list"][:4]
+
+    rframe = Frame.deserialize(data, copy=True)
+    # The buffer is not held by a frame deserialized with `copy`
+    data.extend(b"more")
+    assert rframe["str"] == "a string"
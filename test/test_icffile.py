@@ -1,6 +1,14 @@
 import pytest
 from icf import pyicf
+from icf.frame import Frame
+import io
+import json
 import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
 
 
 @pytest.fixture(params=[pyicf.ICFFile])
@@ -125,3 +133,789 @@ def test_bunch_buffer():
     bf[n] = [n]
     assert n in bf, "New element in Bunch Buffer"
     assert 0 not in bf, "Oldest element removed from Bunch Buffer"
+
+
+def test_array_backed_index(icf_impl):
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=50)
+    data = [bytes([i]) * (10 + i) for i in range(12)]
+    for d in data:
+        f.write(d)
+    # Objects in bunches that are already flushed are still readable
+    assert f.read_at(0) == data[0], "Read back data from flushed bunch"
+    f.close()
+
+    f = icf_impl("/tmp/test.icf")
+    assert f._index.sizes.dtype == np.uint32
+    assert list(f._index.sizes) == [len(d) for d in data], "Correct object sizes"
+    assert f._index.bunches[-1] == len(f._bunch_ids) - 1, "Correct bunch numbers"
+    assert f[:] == data, "Read back correct data"
+    assert f.read_at(-1) == data[-1], "Negative indexing"
+
+
+def test_persisted_index(icf_impl, monkeypatch):
+    for path in ["/tmp/test.icf", "/tmp/test.icf.idx"]:
+        try:
+            os.remove(path)
+        except:
+            pass
+    f = icf_impl("/tmp/test.icf", bunchsize=50, persist_index=True)
+    data = [bytes([i]) * (10 + i) for i in range(12)]
+    for d in data:
+        f.write(d)
+    f.close()
+    assert os.path.exists("/tmp/test.icf.idx"), "Index file written on close"
+
+    def no_scan(self):
+        raise AssertionError("The file should not be scanned")
+
+    with monkeypatch.context() as m:
+        m.setattr(icf_impl, "_scan_file", no_scan)
+        f = icf_impl("/tmp/test.icf", mode="r")
+        assert f[:] == data, "Read back correct data using the persisted index"
+        f.close()
+
+    # Concatenating another file makes the index stale and the file is scanned again
+    try:
+        os.remove("/tmp/test2.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test2.icf")
+    f.write(b"appended")
+    f.close()
+    os.system("cat /tmp/test2.icf >> /tmp/test.icf")
+    f = icf_impl("/tmp/test.icf", mode="r")
+    assert f.size() == 13, "Stale index is not used"
+    assert f.read_at(12) == b"appended"
+    f.close()
+
+    # A sidecar index with a valid header but a short body is not used
+    f = icf_impl("/tmp/test.icf", mode="r")
+    f.save_index()
+    f.close()
+    with open("/tmp/test.icf.idx", "rb") as idx:
+        index_data = idx.read()
+    with open("/tmp/test.icf.idx", "wb") as idx:
+        idx.write(index_data[:-4])
+    f = icf_impl("/tmp/test.icf", mode="r")
+    assert f[:] == data + [b"appended"]
+    f.close()
+
+    # Truncating the file removes its sidecar index
+    f = icf_impl("/tmp/test.icf", mode="trunc")
+    assert not os.path.exists("/tmp/test.icf.idx")
+    f.close()
+
+
+def test_mmap_read(icf_impl):
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=200)
+    frames = []
+    for i in range(10):
+        frame = Frame()
+        frame["arr"] = np.arange(i + 5, dtype=np.float64)
+        frame["name"] = "frame{}".format(i)
+        frame["raw"] = b"raw"
+        frames.append(frame)
+        f.write(frame.serialize())
+    f.close()
+
+    f = icf_impl("/tmp/test.icf", mode="r", use_mmap=True)
+    data = f[:]
+    assert all(isinstance(d, memoryview) for d in data), "Zero-copy views returned"
+    for d, frame in zip(data, frames):
+        rframe = Frame.deserialize(d)
+        assert np.all(rframe["arr"] == frame["arr"]), "Correct array from view"
+        assert rframe["name"] == frame["name"], "Correct string from view"
+        assert rframe["raw"] == b"raw", "Correct bytes from view"
+    del data, rframe
+    f.close()
+
+    with pytest.raises(ValueError):
+        icf_impl("/tmp/test.icf", use_mmap=True)
+
+
+@pytest.mark.parametrize("compressor", ["zlib", "bz2", "lzma"])
+def test_compressed_bunches(icf_impl, compressor):
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=5000, compressor=compressor)
+    data = [np.zeros(100).tobytes() + bytes([i]) for i in range(30)]
+    for d in data:
+        f.write(d)
+    assert f.read_at(0) == data[0], "Read back compressed data while writing"
+    f.close()
+    assert os.path.getsize("/tmp/test.icf") < sum(len(d) for d in data) / 4
+
+    f = icf_impl("/tmp/test.icf", mode="r")
+    assert f.compression & 0xFF == pyicf.compression.codecs[compressor].id
+    assert f[:] == data, "Read back correct data"
+    assert f[::-1] == data[::-1], "Read back correct data from the bunch buffer"
+
+
+def test_prefetching_iterator(icf_impl):
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=100, compressor="zlib")
+    data = [bytes([i % 256]) * (10 + i % 7) for i in range(200)]
+    for d in data:
+        f.write(d)
+    assert list(f.iter(prefetch=3)) == data, "Iterate while writing"
+    f.close()
+    f = icf_impl("/tmp/test.icf")
+    assert list(f.iter(prefetch=3, workers=2)) == data, "Prefetching iteration"
+    assert list(f) == data, "Sequential iteration"
+    it = f.iter(prefetch=2)
+    assert next(it) == data[0]
+    it.close()
+
+
+def test_read_many(icf_impl, monkeypatch):
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=100)
+    data = [bytes([i % 256]) * (10 + i % 7) for i in range(200)]
+    for d in data:
+        f.write(d)
+    f.close()
+
+    f = icf_impl("/tmp/test.icf")
+    reads = []
+    read_raw = f._read_raw
+
+    def counting_read_raw(pos, size):
+        reads.append(size)
+        return read_raw(pos, size)
+
+    monkeypatch.setattr(f, "_read_raw", counting_read_raw)
+    indices = list(np.random.RandomState(1).randint(0, 200, 500)) + [-1]
+    assert f.read_many(indices) == [data[i] for i in indices], "Correct data and order"
+    assert len(reads) == 1, "Adjacent bunches are coalesced into one read"
+    assert f[10:50:3] == data[10:50:3]
+    assert f[[5, 3]] == [data[5], data[3]]
+    with pytest.raises(IndexError):
+        f.read_many([0, 200])
+
+
+def test_bunch_buffer_lru_byte_budget():
+    bf = pyicf.icffile.BunchBuffer(None, max_bytes=100)
+    for i in range(3):
+        bf[i] = b"0" * 30
+    assert 0 in bf, "Element still in Bunch Buffer"
+    bf.get(0)
+    bf[3] = b"0" * 30
+    assert 0 in bf, "Recently used element kept in Bunch Buffer"
+    assert 1 not in bf, "Least recently used element removed from Bunch Buffer"
+    assert bf.nbytes == 90
+    assert bf.get(1) is None
+    assert bf.stats()["hits"] == 1
+    assert bf.stats()["misses"] == 1
+    assert bf.stats()["evictions"] == 1
+
+
+def test_shared_bunch_buffer(icf_impl):
+    buffer = pyicf.icffile.BunchBuffer(None, max_bytes=1000)
+    files = []
+    for i in range(2):
+        path = "/tmp/test{}.icf".format(i)
+        try:
+            os.remove(path)
+        except:
+            pass
+        f = icf_impl(path, bunchsize=100)
+        for j in range(10):
+            f.write(bytes([i]) * 30)
+        f.close()
+        files.append(icf_impl(path, bunch_buffer=buffer))
+    assert files[0][:] == [bytes([0]) * 30] * 10
+    assert files[1][:] == [bytes([1]) * 30] * 10
+    assert files[0].read_at(9) == bytes([0]) * 30
+    assert buffer.hits > 0 and buffer.misses == 6
+    files[0].close()
+    assert all(k[0] == files[1]._buffer_owner for k in buffer._bunches)
+
+
+def test_async_write(icf_impl):
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=100, async_write=True, compressor="zlib")
+    data = [bytes([i % 256]) * (10 + i % 7) for i in range(300)]
+    for i, d in enumerate(data):
+        f.write(d)
+        if i % 50 == 0:
+            assert f.read_at(i // 2) == data[i // 2], "Read while writing"
+    assert f[:] == data
+    f.close()
+
+    with icf_impl("/tmp/test.icf", mode="r") as f:
+        assert f[:] == data, "Read back data written by the writer thread"
+
+
+def test_async_write_error_propagation(icf_impl):
+    class FailingStream(io.BytesIO):
+        def flush(self):
+            if self.tell() > 100:
+                raise IOError("disk full")
+
+    f = icf_impl("", bunchsize=10, async_write=True, custom_stream=FailingStream())
+    with pytest.raises(IOError):
+        for i in range(100):
+            f.write(b"0" * 20)
+            f.sync()
+    with pytest.raises(IOError):
+        f.write(b"0" * 20)
+    with pytest.raises(IOError):
+        f.close()
+    assert f._writer is None, "Writer thread stopped"
+
+
+def test_write_many(icf_impl):
+    data = [bytes([i % 256]) * (10 + i % 37) for i in range(1000)]
+    for path in ["/tmp/test1.icf", "/tmp/test2.icf"]:
+        try:
+            os.remove(path)
+        except:
+            pass
+    f1 = icf_impl("/tmp/test1.icf", bunchsize=500)
+    for d in data:
+        f1.write(d)
+    f1.close()
+    f2 = icf_impl("/tmp/test2.icf", bunchsize=500)
+    f2.write(data[0])
+    f2.write_many(data[1:400], chunksize=100)
+    f2.write_packed(b"".join(data[400:]), [len(d) for d in data[400:]])
+    assert f2.size() == len(data)
+    assert f2[:] == data, "Read back data while writing"
+    f2.close()
+
+    f1 = icf_impl("/tmp/test1.icf")
+    f2 = icf_impl("/tmp/test2.icf")
+    assert f2[:] == data, "Read back correct data"
+    assert f1._bunch_ids == f2._bunch_ids, "Same bunches as with single writes"
+    with pytest.raises(ValueError):
+        f2.write_packed(b"0" * 10, [5, 6])
+
+
+def test_lazy_index(icf_impl):
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=100)
+    data = [bytes([i % 256]) * (10 + i % 7) for i in range(200)]
+    for d in data:
+        f.write(d)
+    f.close()
+
+    f = icf_impl("/tmp/test.icf", mode="r", lazy_index=True)
+    assert f.size() == len(data), "Correct number of entries"
+    assert len(f._index._loaded) == 0, "No bunch index loaded at open"
+    assert f.read_at(150) == data[150]
+    assert len(f._index._loaded) == 1, "Only the accessed bunch is loaded"
+    assert f.read_at(-1) == data[-1]
+    assert f[[3, 190, 77]] == [data[3], data[190], data[77]]
+    assert list(f.iter(prefetch=2)) == data
+    assert list(f._index.sizes) == [len(d) for d in data]
+
+
+def test_parallel_sub_file_scan(icf_impl):
+    try:
+        os.remove("/tmp/catp.icf")
+    except:
+        pass
+    data = []
+    for i in range(5):
+        path = "/tmp/testp{}.icf".format(i)
+        try:
+            os.remove(path)
+        except:
+            pass
+        f = icf_impl(path, bunchsize=50)
+        for j in range(7):
+            data.append(bytes([i]) * (20 + j))
+            f.write(data[-1])
+        f.close()
+        os.system("cat {} >> /tmp/catp.icf".format(path))
+
+    fserial = icf_impl("/tmp/catp.icf", mode="r", scan_workers=1)
+    fpar = icf_impl("/tmp/catp.icf", mode="r", scan_workers=4)
+    assert len(fpar._file_index) == 5, "Correct number of sub files"
+    assert fpar._bunch_ids == fserial._bunch_ids, "Same bunches as serial scan"
+    assert fpar[:] == data, "Correct data"
+
+
+def test_dataset(tmp_path, monkeypatch):
+    data = []
+    for i in range(4):
+        f = pyicf.ICFFile(str(tmp_path / "data{}.icf".format(i)), bunchsize=50)
+        for j in range(5 + i):
+            data.append(bytes([i, j]) * 10)
+            f.write(data[-1])
+        f.close()
+    cache = str(tmp_path / "cache.json")
+    ds = pyicf.ICFDataset(str(tmp_path / "data*.icf"), max_open_files=2, cache_file=cache)
+    assert len(ds) == len(data), "Correct number of entries"
+    assert ds.read_at(7) == data[7]
+    assert ds[-1] == data[-1]
+    assert ds[3:20:2] == data[3:20:2]
+    assert ds[[25, 0, 12]] == [data[25], data[0], data[12]]
+    assert list(ds) == data
+    assert len(ds._open_files) <= 2, "Bounded number of open files"
+    ds.close()
+    with open(cache) as f:
+        for entry in json.load(f).values():
+            assert set(entry) == {"size", "mtime", "n_entries"}, "Only metadata cached"
+
+    def no_open(*args, **kwargs):
+        raise AssertionError("Unchanged files should not be opened")
+
+    pyicf.dataset.ICFFile, icffile = no_open, pyicf.dataset.ICFFile
+    try:
+        ds = pyicf.ICFDataset(str(tmp_path / "data*.icf"), cache_file=cache)
+    finally:
+        pyicf.dataset.ICFFile = icffile
+    assert len(ds) == len(data), "Entry counts read from cache"
+
+    def no_scan(self):
+        raise AssertionError("The file should not be scanned")
+
+    # Files are scanned once when the dataset is created without a cache, and
+    # not when they are reopened after eviction or read using the cache
+    datasets = [pyicf.ICFDataset(str(tmp_path / "data*.icf"), max_open_files=1)]
+    monkeypatch.setattr(pyicf.ICFFile, "_scan_file", no_scan)
+    datasets.append(
+        pyicf.ICFDataset(
+            str(tmp_path / "data*.icf"), max_open_files=1, cache_file=cache
+        )
+    )
+    for ds in datasets:
+        for _ in range(3):
+            assert ds.read_many(range(len(data))) == data
+        ds.close()
+
+
+def test_compact(tmp_path):
+    from icf.pyicf.compact import compact
+
+    data = []
+    cat_path = str(tmp_path / "cat.icf")
+    for i in range(3):
+        path = str(tmp_path / "data{}.icf".format(i))
+        f = pyicf.ICFFile(path, bunchsize=30, header_ext=b"ext", file_identifier_ext="T")
+        for j in range(10):
+            data.append(bytes([i, j]) * 10)
+            f.write(data[-1])
+        f.close()
+        os.system("cat {} >> {}".format(path, cat_path))
+
+    out_path = str(tmp_path / "compact.icf")
+    assert compact(cat_path, out_path, bunchsize=200, compressor="zlib") == len(data)
+    f = pyicf.ICFFile(out_path, mode="r")
+    assert f[:] == data, "Object order preserved"
+    assert len(f._file_index) == 1, "Single sub file"
+    assert len(f._bunch_ids) == 3, "Re-bunched to the target bunch size"
+    assert f.header_ext == b"ext", "Header extension preserved"
+    assert f.file_identifier_ext == "T", "File identifier extension preserved"
+    with pytest.raises(ValueError):
+        compact(out_path, out_path)
+
+    # The inputs are streamed without keeping their object tables
+    r = pyicf.ICFFile(cat_path, mode="r", lazy_index=True)
+    assert list(r.iter(prefetch=2, cache_index=False)) == data
+    assert len(r._index._loaded) == 0
+    assert all(bt.objsize is None for bt in r._rawindex.values())
+    r.close()
+    other = str(tmp_path / "other.icf")
+    pyicf.ICFFile(other, header_ext=b"other").close()
+    with pytest.raises(ValueError):
+        compact([cat_path, other], str(tmp_path / "mixed.icf"))
+    assert not os.path.exists(str(tmp_path / "mixed.icf")), "Checked before writing"
+
+
+def test_time_range(icf_impl):
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=100, record_timestamps=True)
+    data = [bytes([i]) * 30 for i in range(20)]
+    for d in data[:10]:
+        f.write(d)
+    time.sleep(0.01)
+    t_mid = time.time()
+    time.sleep(0.01)
+    for d in data[10:]:
+        f.write(d)
+    assert f.time_range(t_mid, t_mid + 100) == data[10:], "Per object time selection"
+    assert len(f._record_times) == 0, "Timestamps of written bunches not kept"
+    f.close()
+
+    f = icf_impl("/tmp/test.icf", mode="r", lazy_index=True)
+    assert f.time_range(t_mid, t_mid + 100) == data[10:], "Read back object timestamps"
+    assert list(f.time_range_indices(0, t_mid)) == list(range(10))
+    assert len(f.time_range_indices(t_mid + 100, t_mid + 200)) == 0
+
+    try:
+        os.remove("/tmp/test.icf")
+    except:
+        pass
+    f = icf_impl("/tmp/test.icf", bunchsize=100)
+    for d in data:
+        f.write(d)
+    f.close()
+    f = icf_impl("/tmp/test.icf", mode="r")
+    now = datetime.now()
+    assert f.time_range(datetime.fromtimestamp(0), now) == data, "Bunch time selection"
+    assert f.time_range(now + timedelta(seconds=10), now + timedelta(seconds=20)) == []
+
+
+def test_stats(icf_impl, tmp_path):
+    path = str(tmp_path / "stats.icf")
+    events = []
+    f = icf_impl(
+        path, bunchsize=100, stats_hook=lambda name, value: events.append(name)
+    )
+    data = [bytes([i]) * 30 for i in range(20)]
+    for d in data[:10]:
+        f.write(d)
+    f.write_many(data[10:])
+    f.close()
+    stats = f.stats()
+    assert stats["records_written"] == 20
+    assert stats["bytes_written"] == 600
+    assert stats["flushes"] == 5
+    assert stats["flush_time"] > 0
+    assert "flushes" in events, "Hook called"
+
+    f = icf_impl(path, mode="r", instrument=True)
+    assert f.stats()["scan_time"] > 0
+    f.read_at(0)
+    f.read_at(1)
+    stats = f.stats()
+    assert stats["bunch_loads"] == 1
+    assert stats["buffer_hits"] == 1
+    assert stats["seeks"] == 1
+    assert stats["bytes_read"] == 120
+    f.close()
+
+    f = icf_impl(path, mode="r")
+    f.read_at(0)
+    assert set(f.stats()) == {"buffer"}, "No counters when not instrumented"
+    f.close()
+
+    # Counters updated from several threads do not lose updates
+    f = icf_impl(path, mode="r", instrument=True)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [
+            threading.Thread(
+                target=lambda: [f._record("seeks", 1) for _ in range(10000)]
+            )
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert f.stats()["seeks"] == 40000
+    f.close()
+
+
+def test_pickle_and_parallel_map(icf_impl, tmp_path):
+    import pickle
+    import multiprocessing
+
+    path = str(tmp_path / "parallel.icf")
+    data = [bytes([i % 256]) * (i % 50) for i in range(500)]
+    f = icf_impl(path, bunchsize=1000)
+    for d in data:
+        f.write(d)
+    f.close()
+
+    f = icf_impl(path, mode="r", lazy_index=True)
+    f.read_at(3)
+    g = pickle.loads(pickle.dumps(f))
+    assert g.size() == 500
+    assert g[:] == data
+    g.close()
+    g = pickle.loads(pickle.dumps(icf_impl(path, mode="r", instrument=True)))
+    assert g.stats()["scan_time"] == 0, "Unpickled reader does not scan the file"
+    g.close()
+
+    w = icf_impl(str(tmp_path / "writer.icf"))
+    with pytest.raises(TypeError):
+        pickle.dumps(w)
+    w.close()
+
+    expected = [len(d) for d in data]
+    for method in ["fork", "spawn"]:
+        ctx = multiprocessing.get_context(method)
+        assert pyicf.parallel_map(len, f, workers=2, mp_context=ctx) == expected
+    assert (
+        pyicf.parallel_map(len, f, workers=3, chunks_by_bunch=False) == expected
+    ), "Split without bunch boundaries"
+    assert f[:] == data, "Parent handle unaffected"
+
+    # A child forked while another thread holds the locks of the reader
+    # does not use the inherited locks
+    def child():
+        f.refresh()
+        assert f.read_at(3) == data[3]
+        assert f.read_many([4, 5]) == data[4:6]
+        assert list(f.iter(prefetch=0)) == data
+
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_locks():
+        with f._io_lock, f._bunch_buffer._lock:
+            locked.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold_locks)
+    holder.start()
+    locked.wait()
+    p = multiprocessing.get_context("fork").Process(target=child)
+    p.start()
+    p.join(10)
+    release.set()
+    holder.join()
+    if p.exitcode is None:
+        p.kill()
+    assert p.exitcode == 0, "Child did not deadlock"
+    f.close()
+
+
+def test_refresh_and_follow(icf_impl, tmp_path):
+    path = str(tmp_path / "follow.icf")
+    data = [bytes([i]) * 30 for i in range(40)]
+    w = icf_impl(path, mode="trunc", bunchsize=100)
+    readers = [
+        icf_impl(path, mode="r"),
+        icf_impl(path, mode="r", lazy_index=True),
+        icf_impl(path, mode="r", use_mmap=True),
+    ]
+    for r in readers:
+        assert r.size() == 0
+        assert r.refresh() == 0
+    for d in data[:10]:
+        w.write(d)
+    w.flush()
+    for r in readers:
+        assert r.refresh() == 10
+        assert r[:] == data[:10]
+        assert r.refresh() == 0
+    for d in data[10:20]:
+        w.write(d)
+    w.close()
+    for r in readers:
+        assert r.refresh() == 10
+
+    # A sub file appended in two steps, the first of which ends in the middle
+    # of a bunch trailer
+    other = str(tmp_path / "other.icf")
+    w = icf_impl(other, mode="trunc", bunchsize=100)
+    for d in data[20:]:
+        w.write(d)
+    w.close()
+    with open(other, "rb") as f:
+        sub_file = f.read()
+    with open(path, "ab") as f:
+        f.write(sub_file[:-10])
+    for r in readers:
+        assert r.refresh() == 0, "Incomplete bunch is not indexed"
+        assert r[:] == data[:20]
+    with open(path, "ab") as f:
+        f.write(sub_file[-10:])
+    for r in readers:
+        assert r.refresh() == 20
+        assert r[:] == data
+        assert list(r.follow(start=35, poll_interval=0.01, timeout=0.05)) == data[35:]
+        r.close()
+
+
+def test_append(icf_impl, tmp_path, monkeypatch):
+    path = str(tmp_path / "append.icf")
+    data = [bytes([i]) * 30 for i in range(40)]
+    f = icf_impl(path, bunchsize=100)
+    for d in data[:10]:
+        f.write(d)
+    f.close()
+    f = icf_impl(path, bunchsize=100)
+    for d in data[10:20]:
+        f.write(d)
+    f.close()
+    f = icf_impl(path, mode="r")
+    assert f[:] == data[:20], "Appending continues the bunch chain"
+    f.close()
+
+    def no_scan(self):
+        raise AssertionError("The file should not be scanned")
+
+    with monkeypatch.context() as m:
+        m.setattr(icf_impl, "_scan_file", no_scan)
+        f = icf_impl(path, mode="append_only", bunchsize=100)
+        for d in data[20:30]:
+            f.write(d)
+    f.write(data[30])
+    assert f.size() == 31, "Index built on first read"
+    assert f[:] == data[:31]
+    for d in data[31:]:
+        f.write(d)
+    assert f.read_at(39) == data[39]
+    f.close()
+
+    # Appending to the last of several concatenated sub files
+    with open(path, "rb") as f:
+        sub_file = f.read()
+    with open(path, "ab") as f:
+        f.write(sub_file)
+    f = icf_impl(path, mode="append_only", bunchsize=100)
+    f.write(b"last")
+    f.close()
+    f = icf_impl(path, mode="r")
+    assert f[:] == data + data + [b"last"]
+    f.close()
+
+
+def test_async_file(tmp_path):
+    import asyncio
+
+    path = str(tmp_path / "async.icf")
+    data = [bytes([i]) * 30 for i in range(40)]
+
+    async def write():
+        async with pyicf.AsyncICFFile(path, mode="trunc", bunchsize=100) as f:
+            for d in data:
+                await f.write(d)
+            assert await f.read_at(39) == data[39], "Read from the current bunch"
+            await f.flush()
+
+    async def read(**kwargs):
+        async with pyicf.AsyncICFFile(path, mode="r", instrument=True, **kwargs) as f:
+            objs = await asyncio.gather(*[f.read_at(i) for i in range(4)])
+            assert objs == data[:4]
+            assert f.file.stats()["bunch_loads"] == 1, "Concurrent loads de-duplicated"
+            assert await f.read_many([5, 38, -1]) == [data[5], data[38], data[39]]
+            assert [obj async for obj in f] == data
+            with pytest.raises(IndexError):
+                await f.read_at(40)
+
+    asyncio.run(write())
+    asyncio.run(read())
+    asyncio.run(read(lazy_index=True))
+
+
+def test_refresh_incomplete_tail(icf_impl, tmp_path):
+    path = str(tmp_path / "tail.icf")
+    data = [bytes([i]) * (10 + i) for i in range(30)]
+    f = icf_impl(path, bunchsize=100)
+    for d in data[:10]:
+        f.write(d)
+    f.close()
+    with open(path, "rb") as f:
+        base = f.read()
+    f = icf_impl(path, bunchsize=100, record_timestamps=True)
+    for d in data[10:]:
+        f.write(d)
+    f.close()
+    with open(path, "rb") as f:
+        tail = f.read()[len(base) :]
+
+    # Cut the appended tail at every byte
+    for cut in range(len(tail) + 1):
+        with open(path, "wb") as f:
+            f.write(base)
+        r = icf_impl(path, mode="r")
+        with open(path, "ab") as f:
+            f.write(tail[:cut])
+        n_new = r.refresh()
+        assert r.size() == 10 + n_new
+        assert r[:] == data[: r.size()]
+        if cut == len(tail):
+            assert n_new == 20
+        r.close()
+
+
+def test_open_incomplete_tail(icf_impl, tmp_path):
+    path = str(tmp_path / "tail.icf")
+    data = [bytes([i]) * (10 + i) for i in range(30)]
+    # The tail is appended to a file with bunches and to a file with only a header
+    for n_base in [10, 0]:
+        f = icf_impl(path, mode="trunc", bunchsize=100)
+        for d in data[:n_base]:
+            f.write(d)
+        f.close()
+        with open(path, "rb") as f:
+            base = f.read()
+        f = icf_impl(path, bunchsize=100, record_timestamps=True)
+        for d in data[n_base:]:
+            f.write(d)
+        f.close()
+        with open(path, "rb") as f:
+            tail = f.read()[len(base) :]
+
+        # Open the file with the appended tail cut at every byte
+        for cut in range(len(tail) + 1):
+            with open(path, "wb") as f:
+                f.write(base + tail[:cut])
+            r = icf_impl(path, mode="r")
+            assert r.size() >= n_base
+            assert r[:] == data[: r.size()]
+            if cut == len(tail):
+                assert r.size() == 30
+            with open(path, "ab") as f:
+                f.write(tail[cut:])
+            r.refresh()
+            assert r.size() == 30
+            r.close()
+
+
+def test_time_range_concatenated(tmp_path, monkeypatch):
+    from icf.pyicf import icffile
+
+    now = [1000.0]
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(now[0])
+
+    monkeypatch.setattr(icffile, "datetime", Clock)
+    monkeypatch.setattr(icffile.time, "time_ns", lambda: int(now[0] * 1e9))
+
+    path_a, path_b = str(tmp_path / "a.icf"), str(tmp_path / "b.icf")
+    b = pyicf.ICFFile(path_b, record_timestamps=True)
+    b.write(b"b")
+    now[0] = 1001.0
+    a = pyicf.ICFFile(path_a, record_timestamps=True)
+    a.write(b"a")
+    a.close()
+    now[0] = 1002.0
+    b.close()
+    path = str(tmp_path / "ab.icf")
+    with open(path, "wb") as f:
+        for p in [path_a, path_b]:
+            with open(p, "rb") as sub_file:
+                f.write(sub_file.read())
+
+    f = pyicf.ICFFile(path, mode="r")
+    assert f.time_range(999.7, 1000.3) == [b"b"], "Lower bound reset per sub file"
+    assert f.time_range(1000.7, 1001.3) == [b"a"]
+    f.close()